@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+
+"""
+ParseScrapeGenerate benchmarks.
+
+Usage:
+    bench.py [options]
+
+Options:
+    -h --help              Show help
+    --sizes=<n,...>        Entries per listing page [default: 10,100,1000,10000]
+    --article-size=<b>     Bytes of text per article page [default: 2000]
+    --content=<n>          Fetch full content for the first n entries of each
+                           listing with get_content [default: 0]
+    --latency=<ms>         Latency added to each response [default: 0]
+    --workers=<n>          Extract entries on a pool of n processes [default: 1]
+    --repeat=<n>           Runs per case, the fastest is kept [default: 3]
+    --trace-alloc          Trace allocations with tracemalloc (slower)
+    --save=<file>          Save the results as a baseline
+    --compare=<file>       Compare the results against a saved baseline
+    --tolerance=<pct>      Allowed slowdown against the baseline [default: 20]
+    --memory-tolerance=<pct>
+                           Allowed growth of peak RSS and traced allocations
+                           against the baseline [default: 10]
+
+Generates listing pages of synthetic entries, serves them from a local
+threaded HTTP server, and times parse, scrape and generate end to end, along
+with the per-stage timings from `parsescrapegenerate.stats`. Each run is made
+in a fresh process, so that its peak RSS is its own. Exits non-zero if any
+case is slower, or uses more memory, than the baseline by more than the
+tolerances.
+"""
+import docopt
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from parsescrapegenerate import main, stats
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do '
+         'eiusmod tempor incididunt ut labore et dolore magna aliqua').split()
+
+def generate_listing(entries):
+    """
+    Return a listing page with the given number of entries.
+    """
+    parts = ['<!doctype html><html lang="en"><head><title>Listing</title>'
+             '</head><body>']
+    for i in range(entries):
+        parts.append(
+            '<div class="entry"><h2 class="title">'
+            '<a href="/article/{0}.html">Entry {0}</a></h2>'
+            '<div class="content"><p>{1}</p></div></div>'.format(
+                i, ' '.join(WORDS[j % len(WORDS)] for j in range(i, i + 30))))
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+
+def generate_article(size):
+    """
+    Return an article page with roughly size bytes of text.
+    """
+    words = []
+    length = 0
+    while length < size:
+        word = WORDS[len(words) % len(WORDS)]
+        words.append(word)
+        length += len(word) + 1
+    return ('<!doctype html><html><head><title>Article</title></head><body>'
+            '<div class="article"><p>{0}</p></div></body></html>').format(
+                ' '.join(words))
+
+
+class SiteServer(ThreadingMixIn, HTTPServer):
+    """
+    Local stand-in for a scraped site. Serves /list/<n>.html and
+    /article/<i>.html, waiting latency seconds before each response.
+    """
+    daemon_threads = True
+
+    def __init__(self, article_size=2000, latency=0):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), SiteHandler)
+        self.article_size = article_size
+        self.latency = latency
+        self.listings = {}
+        self.article = generate_article(article_size).encode('utf-8')
+
+    @property
+    def base(self):
+        return 'http://127.0.0.1:{0}'.format(self.server_port)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        if self.path.startswith('/list/'):
+            entries = int(self.path[6:].split('.')[0])
+            if entries not in server.listings:
+                server.listings[entries] = generate_listing(entries).encode(
+                    'utf-8')
+            body = server.listings[entries]
+        elif self.path.startswith('/article/'):
+            body = server.article
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def feed_config(base, entries, content=0, workers=1):
+    config = {
+        'title': 'Benchmark',
+        'path': '{0}/list/{1}.html'.format(base, entries),
+        'entry': {
+            'templates': {'link': base + '{{ entry.link }}'},
+            'xpath': {
+                'context': "//div[@class='entry']",
+                'title': "h2[@class='title']/a/text()",
+                'link': "h2[@class='title']/a/@href",
+                'content': "div[@class='content']",
+            },
+        },
+    }
+    if workers > 1:
+        config['entry']['workers'] = workers
+    if content:
+        config['entry']['templates']['content'] = (
+            "{{% if entry.link.split('/')[-1].split('.')[0]|int < {0} %}}"
+            "{{{{ get_content('{1}' ~ entry.link, '//div[@class=\"article\"]') }}}}"
+            "{{% else %}}{{{{ entry.content }}}}{{% endif %}}").format(content, base)
+        config['entry']['prefetch'] = True
+    return config
+
+
+def run_case(base, entries, content=0, trace_alloc=False, workers=1):
+    """
+    Time one parse, scrape and generate of a listing page with the given
+    number of entries, served from base, returning the results as a dict.
+    """
+    config = feed_config(base, entries, content, workers)
+    stats.reset()
+    if trace_alloc:
+        tracemalloc.start()
+
+    start = time.time()
+    with stats.timer('bench.scrape'):
+        feed = main.scrape(config)
+    with stats.timer('bench.generate'):
+        xml = main.generate(feed)
+    with stats.timer('bench.parse'):
+        main.parse(xml, fast=True)
+    elapsed = time.time() - start
+
+    report = stats.report()
+    result = {
+        'entries': len(feed.entries),
+        'seconds': elapsed,
+        'entries_per_second': len(feed.entries) / elapsed if elapsed else 0,
+        'stages': report['timings'],
+        'counters': report['counters'],
+    }
+    if trace_alloc:
+        current, peak = tracemalloc.get_traced_memory()
+        result['alloc_peak_bytes'] = peak
+        result['alloc_blocks'] = len(tracemalloc.take_snapshot().traces)
+        tracemalloc.stop()
+    if resource is not None:
+        result['peak_rss_kb'] = resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+def run_isolated(*args):
+    """
+    Run `run_case` with the given arguments in a newly spawned process.
+    """
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(1, mp_context=context) as pool:
+        return pool.submit(run_case, *args).result()
+
+
+MEMORY_KEYS = ('peak_rss_kb', 'alloc_peak_bytes')
+
+def compare(results, baseline, tolerance, memory_tolerance):
+    """
+    Return a list of the cases that are slower than the baseline by more
+    than tolerance percent, or whose peak RSS or traced allocations grew by
+    more than memory_tolerance percent.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        before = baseline[name]['entries_per_second']
+        after = result['entries_per_second']
+        if before and after < before * (1 - tolerance / 100.0):
+            regressions.append('{0}: {1:.0f} entries/s, baseline {2:.0f}'.format(
+                name, after, before))
+        for key in MEMORY_KEYS:
+            before = baseline[name].get(key)
+            after = result.get(key)
+            if before and after and after > before * (1 + memory_tolerance / 100.0):
+                regressions.append('{0}: {1} {2}, baseline {3}'.format(
+                    name, after, key, before))
+    return regressions
+
+
+def main_bench():
+    args = docopt.docopt(__doc__)
+    sizes = [int(size) for size in args['--sizes'].split(',')]
+    content = int(args['--content'])
+    repeat = int(args['--repeat'])
+    workers = int(args['--workers'])
+    if args['--trace-alloc'] and tracemalloc is None:
+        sys.exit('tracemalloc is not available')
+
+    server = SiteServer(int(args['--article-size']),
+                        float(args['--latency']) / 1000).start()
+    results = {}
+    try:
+        for size in sizes:
+            name = 'listing-{0}-content-{1}'.format(size, min(content, size))
+            runs = [run_isolated(server.base, size, content,
+                                 args['--trace-alloc'], workers)
+                    for _ in range(repeat)]
+            results[name] = min(runs, key=lambda run: run['seconds'])
+            result = results[name]
+            print('{0:<32} {1:>8} entries {2:>9.3f}s {3:>10.0f} entries/s'.format(
+                name, result['entries'], result['seconds'],
+                result['entries_per_second']))
+            for stage, timing in sorted(result['stages'].items()):
+                print('    {0:<28} {1:>9.3f}s {2:>8} calls {3:>9.5f}s p99'.format(
+                    stage, timing['total'], timing['count'], timing['p99']))
+            for key in ('peak_rss_kb', 'alloc_peak_bytes', 'alloc_blocks'):
+                if key in result:
+                    print('    {0:<28} {1:>10}'.format(key, result[key]))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    if args['--save']:
+        with open(args['--save'], 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args['--compare']:
+        with open(args['--compare']) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, float(args['--tolerance']),
+                              float(args['--memory-tolerance']))
+        if regressions:
+            print('Regressions:')
+            for regression in regressions:
+                print('    ' + regression)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main_bench()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+"""
+ParseScrapeGenerate entry memory benchmark.
+
+Usage:
+    memory.py [options]
+
+Options:
+    -h --help              Show help
+    --entries=<n>          Number of entries to hold [default: 50000]
+    --content-size=<b>     Bytes of content per entry [default: 200]
+
+Builds the given number of entries as plain objects with a ``__dict__`` (as
+`feed.Entry` used to be), as slotted `feed.Entry` objects, and as a
+`feed.EntryBatch`, and reports the memory each holds, as traced by
+tracemalloc, along with the time taken to render them as RSS.
+"""
+import docopt
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from parsescrapegenerate import feed
+
+class DictEntry:
+    def __init__(self):
+        self.id        = ''
+        self.title     = ''
+        self.updated   = ''
+        self.published = ''
+        self.link      = ''
+        self.content   = ''
+
+
+def iter_entries(cls, count, content_size):
+    for i in range(count):
+        entry = cls()
+        entry.id = 'tag:example.com,2014-07-01:/article/{0}.html'.format(i)
+        entry.title = 'Entry {0}'.format(i)
+        entry.link = 'http://example.com/article/{0}.html'.format(i)
+        entry.published = 'Tue, 01 Jul 2014 03:12:39 Z'
+        entry.content = '<p>{0}</p>'.format('x' * content_size)
+        yield entry
+
+
+def measure(build):
+    """
+    Return the bytes held by the result of build, and the result.
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, result
+
+
+def main_bench():
+    args = docopt.docopt(__doc__)
+    count = int(args['--entries'])
+    content_size = int(args['--content-size'])
+
+    cases = [
+        ('dict entries', lambda: list(iter_entries(DictEntry, count,
+                                                   content_size))),
+        ('slotted entries', lambda: list(iter_entries(feed.Entry, count,
+                                                      content_size))),
+        ('entry batch', lambda: feed.EntryBatch(iter_entries(
+            feed.Entry, count, content_size))),
+    ]
+    rss_feed = feed.get_feed('rss')
+    print('{0:<16} {1:>12} {2:>14} {3:>10}'.format(
+        'case', 'bytes', 'bytes/entry', 'render'))
+    for name, build in cases:
+        size, entries = measure(build)
+        rss_feed.entries = entries
+        start = time.time()
+        for _ in rss_feed.xml_stream():
+            pass
+        elapsed = time.time() - start
+        print('{0:<16} {1:>12} {2:>14.1f} {3:>9.3f}s'.format(
+            name, size, float(size) / count, elapsed))
+        del entries
+        rss_feed.entries = []
+
+
+if __name__ == '__main__':
+    main_bench()
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+
+"""
+parsescrapegenerate.aio
+-----------------------
+
+Asyncio counterparts of `main.parse`, `main.scrape` and `main.generate`, and
+of `fetcher.Fetcher`. Requires Python 3.5+, and aiohttp for HTTP.
+"""
+import asyncio
+import functools
+
+from io import BytesIO
+from urllib.parse import urlparse
+
+from . import __title__, __version__, main
+from .exceptions import PageTooLarge
+from .fetcher import (
+    CHUNK_SIZE, DEFAULT_BACKOFF, DEFAULT_CONNECT_TIMEOUT, DEFAULT_POOL_SIZE,
+    DEFAULT_READ_TIMEOUT, DEFAULT_RETRIES, RETRY_STATUSES, decode_html,
+    fetcher_options, get_charset, parse_html
+)
+from .stats import incr, timer
+
+class AsyncFetcher(object):
+    """
+    aiohttp based counterpart of `fetcher.Fetcher`, taking the same options.
+    At most pool_size connections are kept per host, and connection errors,
+    timeouts and 5xx responses are retried with exponential backoff. Share
+    one fetcher between feeds to share its connections.
+
+    The session is created on first use, so the fetcher must be used and
+    closed within the same event loop. Cache files are read and written on
+    a pool of CACHE_WORKERS threads of the fetcher's own.
+    """
+    CACHE_WORKERS = 2
+
+    def __init__(self, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, pool_size=DEFAULT_POOL_SIZE,
+                 user_agent=None, cache=None, max_page_size=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.user_agent = user_agent or '{0}/{1}'.format(__title__,
+                                                         __version__)
+        self.cache = cache
+        self.max_page_size = max_page_size
+        self._session = None
+        self._cache_executor = None
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Create a fetcher from the ``http`` section of a feed config.
+        """
+        return cls(**fetcher_options(settings))
+
+    @property
+    def session(self):
+        if self._session is None:
+            import aiohttp
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=0,
+                                               limit_per_host=self.pool_size),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout,
+                                              sock_read=self.read_timeout),
+                headers={'User-Agent': self.user_agent})
+        return self._session
+
+    async def get(self, url, headers=None):
+        """
+        GET the given URL, returning an `AsyncResponse` with the whole body.
+        Raises `aiohttp.ClientResponseError` on an error status, and
+        `exceptions.PageTooLarge` if the body exceeds max_page_size bytes.
+        """
+        import aiohttp
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                incr('http.requests')
+                with timer('http'):
+                    async with self.session.get(url, headers=headers) as r:
+                        if last or r.status not in RETRY_STATUSES:
+                            r.raise_for_status()
+                            self._check_size(url, r.content_length or 0)
+                            body = await self._read_limited(url, r)
+                            return AsyncResponse(r.status, r.headers, body)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if last:
+                    raise
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def _read_limited(self, url, r):
+        chunks = []
+        size = 0
+        async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+            size += len(chunk)
+            incr('http.bytes', len(chunk))
+            self._check_size(url, size)
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    def _check_size(self, url, size):
+        if self.max_page_size and size > self.max_page_size:
+            raise PageTooLarge(
+                "{0} is larger than {1} bytes".format(url, self.max_page_size))
+
+    def _cache_io(self, fn, *args):
+        """
+        Run the given cache method on the fetcher's cache threads. These are
+        kept apart from the loop's default executor, as `scrape` threads
+        there may be waiting on the loop.
+        """
+        if self._cache_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._cache_executor = ThreadPoolExecutor(
+                max_workers=self.CACHE_WORKERS)
+        return asyncio.get_event_loop().run_in_executor(
+            self._cache_executor, functools.partial(fn, *args))
+
+    async def get_bytes(self, url):
+        """
+        GET the given URL through the cache, if any, returning the body and
+        the charset from the Content-Type header.
+        """
+        if self.cache is None:
+            r = await self.get(url)
+            return r.body, get_charset(r.headers)
+
+        cached = await self._cache_io(self.cache.get, url)
+        if cached is not None and cached.is_fresh(self.cache.ttl):
+            incr('http.cache_hits')
+            return cached.content, cached.charset
+        headers = cached.conditional_headers() if cached is not None else {}
+        r = await self.get(url, headers=headers)
+        if r.status == 304 and cached is not None:
+            incr('http.not_modified')
+            cached = await self._cache_io(self.cache.touch, url) or cached
+        else:
+            cached = await self._cache_io(self.cache.set, url, r.body,
+                                          r.headers, get_charset(r.headers))
+        return cached.content, cached.charset
+
+    async def get_text(self, url):
+        """
+        GET the given URL and return the decoded body.
+        """
+        return decode(*(await self.get_bytes(url)))
+
+    async def get_tree(self, url, executor=None):
+        """
+        GET the given URL and parse it as HTML in executor, returning the
+        root element.
+        """
+        body, charset = await self.get_bytes(url)
+        return await asyncio.get_event_loop().run_in_executor(
+            executor, parse_html, [body], charset)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._cache_executor is not None:
+            self._cache_executor.shutdown(wait=False)
+            self._cache_executor = None
+
+
+class AsyncResponse(object):
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class BlockingFetcher(object):
+    """
+    `fetcher.Fetcher` interface to an `AsyncFetcher`, for the code `scrape`
+    runs in an executor thread. Requests are made on loop, and the calling
+    thread waits for them. A body given to `preload` is used once, without a
+    request, and `prefetch` downloads many bodies with a single wait.
+    """
+    def __init__(self, fetcher, loop):
+        self.fetcher = fetcher
+        self.loop = loop
+        self._preloaded = {}
+
+    def preload(self, url, body, charset=None):
+        self._preloaded[url] = (body, charset)
+
+    def prefetch(self, urls):
+        """
+        Download the given URLs concurrently on loop and preload their
+        bodies. Failed downloads are left for `get_bytes` to retry, so that
+        their error is raised where the body is used.
+        """
+        urls = [url for url in urls if url not in self._preloaded]
+        if not urls:
+            return
+
+        async def fetch_all():
+            return await asyncio.gather(
+                *[self.fetcher.get_bytes(url) for url in urls],
+                return_exceptions=True)
+
+        results = asyncio.run_coroutine_threadsafe(fetch_all(),
+                                                   self.loop).result()
+        for url, result in zip(urls, results):
+            if not isinstance(result, BaseException):
+                self.preload(url, *result)
+
+    def get_bytes(self, url):
+        if url in self._preloaded:
+            return self._preloaded.pop(url)
+        return asyncio.run_coroutine_threadsafe(
+            self.fetcher.get_bytes(url), self.loop).result()
+
+    def get_text(self, url):
+        return decode(*self.get_bytes(url))
+
+    def get_tree(self, url):
+        body, charset = self.get_bytes(url)
+        return parse_html([body], charset)
+
+    def open(self, url):
+        body, charset = self.get_bytes(url)
+        source = BytesIO(body)
+        source.charset = charset
+        return source
+
+
+def decode(body, charset=None):
+    return decode_html(body, charset)
+
+
+async def parse(feed, fast=False, executor=None):
+    """
+    Run `main.parse` in executor.
+    """
+    return await asyncio.get_event_loop().run_in_executor(
+        executor, main.parse, feed, fast)
+
+
+async def scrape(feed_config, input_feed={}, fetcher=None, executor=None):
+    """
+    Asyncio counterpart of `main.scrape`. The page is downloaded with the
+    given `AsyncFetcher`, or one created for the config's ``http`` settings,
+    and then parsed and scraped in executor (the loop's default if None).
+
+    The ``get_content`` calls of each page's new entries are found before
+    they are rendered, and their documents downloaded together on the loop,
+    with asyncio.gather, so the executor thread waits once per page rather
+    than once per call. Following pages are downloaded on the loop too.
+    """
+    loop = asyncio.get_event_loop()
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = AsyncFetcher.from_settings(feed_config.get('http'))
+    try:
+        blocking = BlockingFetcher(fetcher, loop)
+        path = feed_config['path']
+        if urlparse(path).scheme in ('http', 'https'):
+            blocking.preload(path, *(await fetcher.get_bytes(path)))
+        return await loop.run_in_executor(executor, functools.partial(
+            main.scrape, feed_config, input_feed, fetcher=blocking))
+    finally:
+        if own_fetcher:
+            await fetcher.close()
+
+
+async def generate(feed, executor=None):
+    """
+    Run `main.generate` in executor.
+    """
+    return await asyncio.get_event_loop().run_in_executor(
+        executor, main.generate, feed)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+"""
+parsescrapegenerate.batch
+-------------------------
+
+Scrape many feeds in one process.
+"""
+import functools
+import io
+import os
+import time
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .config import get_config
+from .exceptions import ConfigMissingRequiredKey
+from .main import generate, parse, scrape
+from .utils import write_atomic
+
+CONFIG_EXTENSIONS = ('.yml', '.yaml')
+
+class BatchResult(object):
+    """
+    Outcome of scraping a single feed in a batch.
+    """
+    def __init__(self, config_path, output=None, entries=0, elapsed=0,
+                 error=None):
+        self.config_path = config_path
+        self.output = output
+        self.entries = entries
+        self.elapsed = elapsed
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def find_configs(paths):
+    """
+    Expand the given config paths, replacing each directory with the config
+    files it contains.
+    """
+    configs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(CONFIG_EXTENSIONS):
+                    configs.append(os.path.join(path, name))
+        else:
+            configs.append(path)
+    return configs
+
+
+def run_feed(config_path, fast_parse=False, feed_config=None):
+    """
+    Scrape the feed defined by config_path and write it to the config's
+    ``output`` path. The existing feed is read from the config's ``input``
+    path, which defaults to ``output``. Errors are captured in the returned
+    `BatchResult` rather than raised.
+
+    An already loaded feed_config may be given, in which case config_path is
+    only used to label the result.
+    """
+    start = time.time()
+    result = BatchResult(config_path)
+    try:
+        if feed_config is None:
+            feed_config = get_config(config_path)
+        if 'output' not in feed_config:
+            raise ConfigMissingRequiredKey("Missing required key: output")
+        result.output = feed_config['output']
+        input_path = feed_config.get('input', result.output)
+        input_feed = {}
+        if os.path.exists(input_path):
+            with io.open(input_path, encoding='utf-8') as f:
+                input_feed = parse(f.read(), fast_parse)
+        new_feed = scrape(feed_config, input_feed)
+        write_atomic(result.output, generate(new_feed, stream=True))
+        result.entries = len(new_feed.entries)
+    except Exception:
+        result.error = traceback.format_exc()
+    result.elapsed = time.time() - start
+    return result
+
+
+def run_batch(config_paths, workers=4, processes=False, fast_parse=False):
+    """
+    Run `run_feed` for each of the given configs using a pool of workers
+    threads, or processes if processes is set. Returns the `BatchResult`s in
+    the order the configs were given.
+    """
+    config_paths = find_configs(config_paths)
+    if not config_paths:
+        return []
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor(max_workers=max(1, workers)) as pool:
+        return list(pool.map(functools.partial(run_feed, fast_parse=fast_parse),
+                             config_paths))
+
+
+def format_summary(results):
+    """
+    Return a human readable, per-feed summary of the given results.
+    """
+    lines = []
+    for result in results:
+        if result.ok:
+            lines.append('ok     {0} -> {1} ({2} entries, {3:.2f}s)'.format(
+                result.config_path, result.output, result.entries,
+                result.elapsed))
+        else:
+            error = result.error.strip().splitlines()[-1]
+            lines.append('FAILED {0} ({1:.2f}s): {2}'.format(
+                result.config_path, result.elapsed, error))
+    failed = len([r for r in results if not r.ok])
+    lines.append('{0} feeds, {1} failed'.format(len(results), failed))
+    return '\n'.join(lines)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""
+parsescrapegenerate.cache
+-------------------------
+
+Persistent HTTP response cache for ParseScrapeGenerate.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+_replace = getattr(os, 'replace', os.rename)
+
+LOW_WATERMARK = 0.9
+
+class CachedResponse(object):
+    """
+    A response body read from the cache, along with the validators needed to
+    make a conditional request for it.
+    """
+    def __init__(self, url, content, charset=None, etag=None,
+                 last_modified=None, fetched=0):
+        self.url = url
+        self.content = content
+        self.charset = charset
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched = fetched
+
+    @property
+    def text(self):
+        from .fetcher import decode_html
+        return decode_html(self.content, self.charset)
+
+    def is_fresh(self, ttl):
+        return bool(ttl) and time.time() - self.fetched < ttl
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class HttpCache(object):
+    """
+    Stores response bodies on disk, keyed by URL, along with their ETag and
+    Last-Modified headers. Once the cache grows beyond max_size bytes, the
+    least recently used responses are removed until it is down to
+    LOW_WATERMARK of max_size, so that the cache directory is only scanned
+    once in a while. Responses younger than ttl
+    seconds are served without revalidation.
+    """
+    def __init__(self, directory, max_size=None, ttl=None):
+        self.directory = os.path.expanduser(directory)
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self._size = sum(self._sizes().values())
+
+    def _path(self, url, ext):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + ext)
+
+    def _sizes(self):
+        sizes = {}
+        for name in os.listdir(self.directory):
+            if name.endswith('.body'):
+                try:
+                    sizes[name[:-5]] = os.path.getsize(
+                        os.path.join(self.directory, name))
+                except OSError:
+                    pass
+        return sizes
+
+    def get(self, url):
+        """
+        Return the `CachedResponse` for url, or None if it is not cached.
+        """
+        meta_path = self._path(url, '.json')
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(self._path(url, '.body'), 'rb') as f:
+                content = f.read()
+            os.utime(meta_path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        if meta.get('url') != url:
+            return None
+        return CachedResponse(url, content, meta.get('charset'),
+                              meta.get('etag'), meta.get('last_modified'),
+                              meta.get('fetched', 0))
+
+    def set(self, url, content, headers, charset=None):
+        """
+        Store the given response body and return it as a `CachedResponse`.
+        charset should be the one given by the response headers, if any, so
+        that a charset declared in the document itself still applies.
+        """
+        cached = CachedResponse(url, content, charset, headers.get('ETag'),
+                                headers.get('Last-Modified'), time.time())
+        body_path = self._path(url, '.body')
+        with self._lock:
+            try:
+                old_size = os.path.getsize(body_path)
+            except OSError:
+                old_size = 0
+            self._write(body_path, content)
+            self._write_meta(cached)
+            self._size += len(content) - old_size
+            self._evict()
+        return cached
+
+    def touch(self, url):
+        """
+        Mark url as recently used, and as fetched now for the purposes of ttl.
+        """
+        cached = self.get(url)
+        if cached is not None:
+            cached.fetched = time.time()
+            with self._lock:
+                self._write_meta(cached)
+        return cached
+
+    def _write_meta(self, cached):
+        meta = {
+            'url': cached.url,
+            'charset': cached.charset,
+            'etag': cached.etag,
+            'last_modified': cached.last_modified,
+            'fetched': cached.fetched,
+        }
+        self._write(self._path(cached.url, '.json'),
+                    json.dumps(meta).encode('utf-8'))
+
+    def _write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        _replace(tmp_path, path)
+
+    def _evict(self):
+        if not self.max_size or self._size <= self.max_size:
+            return
+        sizes = self._sizes()
+        used = []
+        for key in sizes:
+            try:
+                used.append((os.path.getmtime(
+                    os.path.join(self.directory, key + '.json')), key))
+            except OSError:
+                used.append((0, key))
+        self._size = sum(sizes.values())
+        for mtime, key in sorted(used):
+            if self._size <= self.max_size * LOW_WATERMARK:
+                break
+            for ext in ('.json', '.body'):
+                try:
+                    os.remove(os.path.join(self.directory, key + ext))
+                except OSError:
+                    pass
+            self._size -= sizes[key]
@@ -3,14 +3,38 @@
 """
 ParseScrapeGenerate. Parse, scrape, and generate feeds.
 
-Usage: parsescrapegenerate <config_path>
+Usage:
+    parsescrapegenerate [--fast-parse] [--stats] [--output=<file> [--gzip]]
+                        <config_path>
+    parsescrapegenerate batch [--workers=<n>] [--processes] [--fast-parse]
+                              [--stats] <path>...
+    parsescrapegenerate daemon [--interval=<s>] [--jitter=<f>] [--workers=<n>]
+                               [--output-dir=<dir>] [--port=<port>]
+                               [--fast-parse] <config_dir>
 
 Arguments:
-    config_path  Path to a feed config file
+    config_path      Path to a feed config file
+    path             Path to a feed config file, or a directory of them
+    config_dir       Directory of feed config files
 
 Options:
-    -h --help    Show help
-    --version    Show version
+    -h --help        Show help
+    --version        Show version
+    --workers=<n>    Number of feeds to scrape at once [default: 4]
+    --processes      Scrape feeds in a process pool instead of a thread pool
+    --fast-parse     Only extract the metadata and entry fields needed from
+                     the existing feed, falling back to a full parse if it is
+                     malformed
+    --stats          Write timings and counters for each stage to STDERR as
+                     JSON (not collected from --processes workers)
+    --output=<file>  Write the feed to file instead of STDOUT, see below
+    --gzip           Also write a gzipped copy of the feed to <file>.gz
+    --interval=<s>   Seconds between runs of feeds that do not set their own
+                     ``interval`` [default: 3600]
+    --jitter=<f>     Spread runs by up to this fraction of the interval
+                     [default: 0.1]
+    --output-dir=<dir>  Where to write feeds whose config has no ``output``
+    --port=<port>    Serve the written feeds, and /status, on this local port
 
 Once invoked, parsescrapegenerate will load config_path, scrape the given site
 looking for entries matching the defined rules. Once all the data is collected
@@ -18,21 +42,100 @@ the resulting XML data will be written to STDOUT. Existing XML data can be read
 from STDIN, in which case, all entries will be extracted and added to the
 resulting output (duplicates will be ignored).
 
+With --output, the feed is written to the given file atomically, and a hash of
+its entries to <file>.sha256. If the entries are unchanged since the last
+write, the file is left untouched and the exit status is 3. If STDIN is empty,
+the existing file is read as the existing feed.
+
+With batch, each config is scraped in turn by a pool of workers. Each config
+must set ``output``, the path the feed is written to, and may set ``input``,
+the path of the existing feed (defaults to ``output``). A summary is written
+to STDERR, and the exit status is non-zero if any feed failed.
+
+With daemon, the configs in config_dir are scraped as with batch, each on its
+own schedule, until interrupted. Configs are reloaded when they change, and
+the process stays up between runs, so templates, connections and caches are
+reused.
+
 """
 import docopt
+import io
+import json
 import os
 import sys
 
 from . import __version__
-from .config import get_config
-from .main import parse, scrape, generate
+from .stats import report, timer
+
+UNCHANGED = 3
 
 def main():
     args = docopt.docopt(__doc__, version=__version__)
-    feed_config = get_config(args['<config_path>'])
-    input_feed = parse(sys.stdin.read()) if not os.isatty(0) else {}
-    new_feed = scrape(feed_config, input_feed)
-    print(generate(new_feed))
+    try:
+        if args['batch']:
+            return batch(args)
+        if args['daemon']:
+            return daemon(args)
+        from .config import get_config
+        from .main import parse, scrape, write, write_file
+        feed_config = get_config(args['<config_path>'])
+        fast = args['--fast-parse']
+        output = args['--output']
+        data = sys.stdin.read() if not os.isatty(0) else ''
+        if not data.strip() and output and os.path.exists(output):
+            with io.open(output, encoding='utf-8') as f:
+                data = f.read()
+        input_feed = parse(data, fast) if data.strip() else {}
+        new_feed = scrape(feed_config, input_feed)
+        if output:
+            with timer('generate'):
+                changed = write_file(new_feed, output, args['--gzip'])
+            if not changed:
+                sys.exit(UNCHANGED)
+            return
+        with timer('generate'):
+            write(new_feed, sys.stdout)
+        sys.stdout.write('\n')
+    finally:
+        if args['--stats']:
+            sys.stdout.flush()
+            json.dump(report(), sys.stderr, indent=2, sort_keys=True)
+            sys.stderr.write('\n')
+
+
+def batch(args):
+    from .batch import format_summary, run_batch
+    results = run_batch(args['<path>'], int(args['--workers']),
+                        args['--processes'], args['--fast-parse'])
+    sys.stderr.write(format_summary(results) + '\n')
+    if not all(result.ok for result in results):
+        sys.exit(1)
+
+
+def daemon(args):
+    import signal
+    from .batch import format_summary
+    from .daemon import Daemon, FeedServer
+    feed_daemon = Daemon(args['<config_dir>'], float(args['--interval']),
+                         float(args['--jitter']), int(args['--workers']),
+                         args['--output-dir'], args['--fast-parse'])
+    server = None
+    if args['--port']:
+        server = FeedServer(feed_daemon, port=int(args['--port'])).start()
+    signal.signal(signal.SIGTERM, lambda *_: feed_daemon.stop())
+
+    def on_results(results):
+        sys.stderr.write(format_summary(results) + '\n')
+        sys.stderr.flush()
+
+    try:
+        feed_daemon.run_forever(on_results)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
 
 
 if __name__ == '__main__':
@@ -12,6 +12,10 @@ import yaml
 from .exceptions import (
     ConfigDoesNotExist, ConfigIsNotValid, ConfigMissingRequiredKey
 )
+from .fetcher import HTTP_SETTINGS
+from .utils import get_xpath_plan
+
+ID_SCHEMES = ('tag', 'url', 'content')
 
 def get_config(config_path):
     """
@@ -45,5 +49,38 @@ def _validate_config(config_dict):
     if 'context' not in config_dict['entry']['xpath']:
         raise ConfigMissingRequiredKey(errmsg.format('context'))
 
+    pagination = config_dict.get('pagination') or {}
+    plan = get_xpath_plan(config_dict['entry']['xpath'])
+    if config_dict['entry'].get('stream'):
+        plan.match
+        if pagination.get('next') or config_dict['entry'].get('workers'):
+            raise ConfigIsNotValid(
+                "stream cannot be combined with pagination or workers")
+
+    if config_dict['entry'].get('id_scheme', 'tag') not in ID_SCHEMES:
+        raise ConfigIsNotValid("id_scheme must be one of: {0}".format(
+            ', '.join(ID_SCHEMES)))
+
+    if 'next' in pagination:
+        get_xpath_plan({'context': pagination['next']})
+
+    for key in ('interval', 'max_entries', 'max_age_days'):
+        _validate_positive(config_dict, key)
+
+    for key in config_dict.get('http') or {}:
+        if key not in HTTP_SETTINGS:
+            raise ConfigIsNotValid("Unknown http setting: {0}".format(key))
+
     return config_dict
 
+
+
+def _validate_positive(config_dict, key):
+    """
+    Validate that key, if set, is a positive number.
+    """
+    value = config_dict.get(key)
+    if value is not None and (isinstance(value, bool) or
+                              not isinstance(value, (int, float)) or
+                              value <= 0):
+        raise ConfigIsNotValid("{0} must be a positive number".format(key))
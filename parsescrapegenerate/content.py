@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+"""
+parsescrapegenerate.content
+---------------------------
+
+Per-scrape handling of the ``get_content`` template function.
+"""
+import threading
+
+from lxml import html
+try:
+    from urllib.parse import urlparse
+except:
+    from urlparse import urlparse
+
+from .stats import bind, incr, timed
+from .utils import LRUCache, extract_content, load_document
+
+DEFAULT_WORKERS = 8
+DEFAULT_PER_HOST = 2
+DEFAULT_MAX_DOCUMENT_BYTES = 64 * 1024 * 1024
+
+class ContentLoader(object):
+    """
+    Drop-in replacement for the ``get_content`` template global that
+    remembers results for the duration of a scrape. Calls can be resolved
+    ahead of rendering with `prefetch`, which fetches them concurrently.
+
+    Loaded documents are kept, parsed, for up to max_document_bytes of source
+    text, so that repeated calls for the same path only run the XPath query.
+    """
+    def __init__(self, workers=DEFAULT_WORKERS, per_host=DEFAULT_PER_HOST,
+                 fetcher=None, max_document_bytes=DEFAULT_MAX_DOCUMENT_BYTES):
+        self.fetcher = fetcher
+        self.workers = workers
+        self.per_host = per_host
+        self._results = {}
+        self._documents = LRUCache(max_document_bytes)
+        self._path_locks = {}
+        self._lock = threading.Lock()
+
+    @timed('get_content')
+    def __call__(self, path, xpath_query=''):
+        key = (path, xpath_query)
+        with self._lock:
+            if key in self._results:
+                incr('get_content.result_hits')
+                return self._results[key]
+            path_lock = self._path_locks.setdefault(path, threading.Lock())
+        with path_lock:
+            text, tree = self._documents.get(path, (None, None))
+            if text is None:
+                text = load_document(path, self.fetcher)
+            else:
+                incr('get_content.document_hits')
+            if xpath_query:
+                if tree is None:
+                    tree = html.fromstring(text)
+                result = extract_content(tree, xpath_query)
+            else:
+                result = text
+            self._documents.set(path, (text, tree), len(text))
+        with self._lock:
+            self._results[key] = result
+        return result
+
+    def find_calls(self, templates, rows):
+        """
+        Render each of the templates against each of the rows of entry vals
+        and return the ``get_content`` calls they make, in order.
+        """
+        recorder = _ContentRecorder()
+        for vals in rows:
+            for template in templates.values():
+                try:
+                    template.render({'entry': vals, 'get_content': recorder})
+                except Exception:
+                    pass
+        return recorder.calls
+
+    def prefetch(self, calls):
+        """
+        Resolve the given (path, xpath_query) calls using a pool of at most
+        `workers` threads, with no more than `per_host` requests in flight to
+        any one host. Failed calls are left unresolved so that the error is
+        raised again when the template is rendered.
+
+        If the fetcher has a ``prefetch`` method, as `aio.BlockingFetcher`
+        does, it is given all the URLs to download at once instead, and the
+        calls are then resolved from the downloaded documents.
+        """
+        with self._lock:
+            pending = []
+            for call in calls:
+                if call not in self._results and call not in pending:
+                    pending.append(call)
+        if not pending:
+            return
+
+        fetch_many = getattr(self.fetcher, 'prefetch', None)
+        if fetch_many is not None:
+            urls = []
+            for path, xpath_query in pending:
+                if (urlparse(path).scheme in ('http', 'https') and
+                        path not in urls and path not in self._documents):
+                    urls.append(path)
+            fetch_many(urls)
+            for call in pending:
+                try:
+                    self(*call)
+                except Exception:
+                    pass
+            return
+
+        host_limits = {}
+        for path, xpath_query in pending:
+            host = urlparse(path).netloc
+            if host not in host_limits:
+                host_limits[host] = threading.Semaphore(self.per_host)
+
+        def fetch(call):
+            with host_limits[urlparse(call[0]).netloc]:
+                try:
+                    self(*call)
+                except Exception:
+                    pass
+
+        from concurrent.futures import ThreadPoolExecutor
+        workers = max(1, min(self.workers, len(pending)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(bind(fetch), pending))
+
+
+class _ContentRecorder(object):
+    """
+    Stand-in for ``get_content`` that records its arguments.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, path, xpath_query=''):
+        self.calls.append((path, xpath_query))
+        return ''
+
+
+def get_content_loader(config, fetcher=None):
+    """
+    Return a `ContentLoader` for the given entry config. The optional
+    ``prefetch`` key may be ``true`` or a dict with ``workers`` and
+    ``per_host`` keys. The optional ``max_document_bytes`` key caps the
+    source size of the documents kept parsed between calls.
+    """
+    prefetch = config.get('prefetch') or {}
+    if not isinstance(prefetch, dict):
+        prefetch = {}
+    return ContentLoader(prefetch.get('workers', DEFAULT_WORKERS),
+                         prefetch.get('per_host', DEFAULT_PER_HOST), fetcher,
+                         config.get('max_document_bytes',
+                                    DEFAULT_MAX_DOCUMENT_BYTES))
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+
+"""
+parsescrapegenerate.daemon
+--------------------------
+
+Long running scheduler for a directory of feed configs.
+"""
+import heapq
+import json
+import os
+import random
+import threading
+import time
+import traceback
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from .batch import BatchResult, find_configs, run_feed
+from .config import get_config
+
+DEFAULT_INTERVAL = 60 * 60
+DEFAULT_JITTER = 0.1
+RELOAD_INTERVAL = 5
+
+class _Feed(object):
+    """
+    A config file known to the daemon. config is None if it failed to load.
+    """
+    def __init__(self, path, mtime, config=None):
+        self.path = path
+        self.mtime = mtime
+        self.config = config
+        self.due = None
+        self.generation = 0
+
+
+class Daemon(object):
+    """
+    Scrapes each config in config_dir on its own interval, keeping the
+    process, and with it the compiled templates and XPaths, pooled HTTP
+    connections and caches, warm between runs.
+
+    Each config may set ``interval`` in seconds, defaulting to interval.
+    Runs are spread by up to jitter times the interval either way. Configs
+    are rescanned every reload_interval seconds; new and changed configs are
+    run straight away, and removed ones are dropped. Configs without an
+    ``output`` are written to output_dir, named after the config file.
+
+    Each run is a separate job on a pool of workers threads, and its feed is
+    scheduled again as soon as it finishes, so a slow site only holds up
+    its own feed.
+    """
+    def __init__(self, config_dir, interval=DEFAULT_INTERVAL,
+                 jitter=DEFAULT_JITTER, workers=4, output_dir=None,
+                 fast_parse=False, reload_interval=RELOAD_INTERVAL):
+        self.config_dir = config_dir
+        self.interval = interval
+        self.jitter = jitter
+        self.workers = max(1, workers)
+        self.output_dir = output_dir
+        self.fast_parse = fast_parse
+        self.reload_interval = reload_interval
+        self.feeds = {}
+        self.results = {}
+        self._queue = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._wakeup = threading.Event()
+        self._running = set()
+        self._deferred = {}
+        self._completed = []
+        self._pool = None
+        self._last_reload = None
+
+    def reload(self, now=None):
+        """
+        Pick up added, changed and removed configs.
+        """
+        now = time.time() if now is None else now
+        self._last_reload = now
+        paths = find_configs([self.config_dir])
+        with self._lock:
+            for path in set(self.feeds) - set(paths):
+                del self.feeds[path]
+                self.results.pop(path, None)
+            for path in paths:
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue
+                feed = self.feeds.get(path)
+                if feed is not None and feed.mtime == mtime:
+                    continue
+                generation = feed.generation + 1 if feed is not None else 0
+                feed = self.feeds[path] = _Feed(path, mtime)
+                feed.generation = generation
+                try:
+                    feed.config = self._load(path)
+                except Exception:
+                    self.results[path] = BatchResult(
+                        path, error=traceback.format_exc())
+                    continue
+                self._schedule(feed, now)
+
+    def _load(self, path):
+        feed_config = get_config(path)
+        if 'output' not in feed_config and self.output_dir:
+            name = os.path.splitext(os.path.basename(path))[0] + '.xml'
+            feed_config['output'] = os.path.join(self.output_dir, name)
+        return feed_config
+
+    def _schedule(self, feed, due):
+        feed.due = due
+        heapq.heappush(self._queue, (due, feed.path, feed.generation))
+
+    def next_interval(self, feed):
+        """
+        Return the seconds to wait before the next run of feed.
+        """
+        interval = feed.config.get('interval', self.interval)
+        return interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def due(self, now=None):
+        """
+        Remove and return the feeds due to run by now, and mark them as
+        running. A feed whose config changed while it was running waits for
+        that run to finish.
+        """
+        now = time.time() if now is None else now
+        feeds = []
+        with self._lock:
+            while self._queue and self._queue[0][0] <= now:
+                due, path, generation = heapq.heappop(self._queue)
+                feed = self.feeds.get(path)
+                if feed is None or feed.generation != generation:
+                    continue
+                feed.due = None
+                if path in self._running:
+                    self._deferred[path] = feed
+                    continue
+                self._running.add(path)
+                feeds.append(feed)
+        return feeds
+
+    def _start(self, now=None, report=False):
+        """
+        Reload the configs if they are due to be rescanned, and start a run
+        of each feed that is due. Returns a future of the
+        `batch.BatchResult` of each run started. If report is set, results
+        are also kept for `completed`.
+        """
+        now = time.time() if now is None else now
+        if (self._last_reload is None or
+                now - self._last_reload >= self.reload_interval):
+            self.reload(now)
+        feeds = self.due(now)
+        if feeds and self._pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        return [self._pool.submit(self._run, feed, now, report)
+                for feed in feeds]
+
+    def _run(self, feed, now, report):
+        start = time.time()
+        try:
+            result = run_feed(feed.path, self.fast_parse, dict(feed.config))
+        except Exception:
+            result = BatchResult(feed.path, error=traceback.format_exc())
+        finished = now + time.time() - start
+        with self._lock:
+            self._running.discard(feed.path)
+            if self.feeds.get(feed.path) is feed:
+                self.results[feed.path] = result
+                self._schedule(feed, finished + self.next_interval(feed))
+            deferred = self._deferred.pop(feed.path, None)
+            if deferred is not None and self.feeds.get(
+                    feed.path) is deferred:
+                self._schedule(deferred, finished)
+            if report:
+                self._completed.append(result)
+        self._wakeup.set()
+        return result
+
+    def tick(self, now=None):
+        """
+        Reload the configs if they are due to be rescanned, run the feeds
+        that are due and wait for them. Returns the `batch.BatchResult` of
+        each feed run.
+        """
+        return [future.result() for future in self._start(now)]
+
+    def completed(self):
+        """
+        Remove and return the results of the runs finished since the last
+        call.
+        """
+        with self._lock:
+            results, self._completed = self._completed, []
+        return results
+
+    def next_run(self):
+        """
+        Return the time the next feed is due, or None if there are none.
+        """
+        with self._lock:
+            dues = [feed.due for feed in self.feeds.values()
+                    if feed.due is not None and feed.config is not None]
+        return min(dues) if dues else None
+
+    def run_forever(self, on_results=None):
+        """
+        Start feeds as they fall due until `stop` is called, calling
+        on_results with the results of the runs that finished, as they
+        finish. Waits for the next feed to fall due, the next rescan of the
+        configs, or a run to finish, whichever comes first.
+        """
+        try:
+            while not self._stopped.is_set():
+                self._wakeup.clear()
+                self._start(report=True)
+                results = self.completed()
+                if results and on_results is not None:
+                    on_results(results)
+                now = time.time()
+                wait = self._last_reload + self.reload_interval - now
+                next_run = self.next_run()
+                if next_run is not None:
+                    wait = min(wait, next_run - now)
+                self._wakeup.wait(max(0, wait))
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+            results = self.completed()
+            if results and on_results is not None:
+                on_results(results)
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def outputs(self):
+        """
+        Return a dict of the feeds written so far, from file name to path.
+        """
+        with self._lock:
+            return dict((os.path.basename(result.output), result.output)
+                        for result in self.results.values()
+                        if result.ok and result.output)
+
+    def status(self):
+        """
+        Return the outcome and next run of each feed as a JSON serializable
+        dict.
+        """
+        with self._lock:
+            status = {}
+            for path, feed in self.feeds.items():
+                result = self.results.get(path)
+                status[path] = {
+                    'next_run': feed.due if feed.config is not None else None,
+                    'running': path in self._running,
+                    'ok': result.ok if result else None,
+                    'output': result.output if result else None,
+                    'entries': result.entries if result else 0,
+                    'elapsed': result.elapsed if result else 0,
+                    'error': result.error if result else None,
+                }
+            return status
+
+
+class FeedServer(ThreadingMixIn, HTTPServer):
+    """
+    Serves the feeds written by daemon as /<output file name>, and the
+    daemon's `Daemon.status` as JSON from /status.
+    """
+    daemon_threads = True
+
+    def __init__(self, daemon, host='127.0.0.1', port=8000):
+        HTTPServer.__init__(self, (host, port), FeedHandler)
+        self.feed_daemon = daemon
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        daemon = self.server.feed_daemon
+        name = self.path.split('?', 1)[0].lstrip('/')
+        if name == 'status':
+            self.respond(json.dumps(daemon.status(), sort_keys=True).encode(
+                'utf-8'), 'application/json')
+            return
+        path = daemon.outputs().get(name)
+        try:
+            with open(path, 'rb') as f:
+                body = f.read()
+        except (IOError, OSError, TypeError):
+            self.send_error(404)
+            return
+        self.respond(body, 'application/xml; charset=utf-8')
+
+    def respond(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
@@ -26,6 +26,13 @@ class ConfigIsNotValid(ParseScrapeGenerateException):
     """
 
 
+class ConfigInvalidXPath(ConfigIsNotValid):
+    """
+    Raised when given config_path contains an XPath query that does not
+    compile.
+    """
+
+
 class ConfigMissingRequiredKey(ParseScrapeGenerateException):
     """
     Raised when given config_path is missing a required key.
@@ -38,6 +45,12 @@ class FeedPathDoesNotExist(ParseScrapeGenerateException):
     """
 
 
+class PageTooLarge(ParseScrapeGenerateException):
+    """
+    Raised when a fetched page is larger than the configured max_page_size.
+    """
+
+
 class InvalidFeedFormat(ParseScrapeGenerateException):
     """
     Raised when given feed format is not valid.
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+"""
+parsescrapegenerate.fastparse
+-----------------------------
+
+Fast, incremental parsing of existing feeds. Only the feed metadata and the
+entry fields used by `main.scrape` are extracted.
+"""
+import calendar
+import re
+import time
+
+from email.utils import mktime_tz, parsedate_tz
+from io import BytesIO
+from lxml import etree
+
+from .exceptions import InvalidFeedFormat
+
+FEED_TAGS = ('rss', 'feed', 'RDF')
+ENTRY_TAGS = ('item', 'entry')
+UPDATED_TAGS = ('updated', 'lastBuildDate', 'pubDate', 'modified', 'date')
+PUBLISHED_TAGS = ('pubDate', 'published', 'issued', 'date')
+ENTRY_UPDATED_TAGS = ('updated', 'modified')
+SUMMARY_TAGS = ('description', 'summary')
+CONTENT_TAGS = ('encoded', 'content')
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+
+ISO_DATE = re.compile(
+    r'^(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.\d+)?)?'
+    r'(Z|[+-]\d{2}:?\d{2})?)?$')
+
+def parse(source):
+    """
+    Parse the given feed document, a string or bytes, returning a dict with
+    the same shape as `feedparser.parse` for the keys `main.scrape` uses.
+
+    Raises `exceptions.InvalidFeedFormat` if source is not an RSS or Atom
+    document, or `lxml.etree.XMLSyntaxError` if it is malformed.
+    """
+    if isinstance(source, type(u'')):
+        source = BytesIO(source.encode('utf-8'))
+        encoding = 'utf-8'
+    else:
+        source = BytesIO(source)
+        encoding = None
+
+    feed = {}
+    entries = []
+    entry = None
+    entry_elem = None
+    root = None
+    for event, elem in etree.iterparse(source, events=('start', 'end'),
+                                       encoding=encoding,
+                                       resolve_entities=False):
+        tag = _local_name(elem.tag)
+        if event == 'start':
+            if root is None:
+                if tag not in FEED_TAGS:
+                    raise InvalidFeedFormat
+                root = elem
+                if elem.get(XML_LANG):
+                    feed['language'] = elem.get(XML_LANG)
+            elif tag in ENTRY_TAGS:
+                entry = {}
+                entry_elem = elem
+            continue
+
+        if tag in ENTRY_TAGS and entry is not None:
+            entries.append(entry)
+            entry = None
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+        elif entry is not None:
+            # Fields of nested elements, such as an Atom <source>, belong to
+            # those elements rather than to the entry.
+            if elem.getparent() is entry_elem:
+                _entry_field(entry, tag, elem)
+        elif tag == 'title' and 'title' not in feed:
+            feed['title'] = (elem.text or '').strip()
+        elif tag == 'language' and elem.text:
+            feed['language'] = elem.text.strip()
+        elif tag in UPDATED_TAGS and 'updated' not in feed and elem.text:
+            feed['updated'] = elem.text.strip()
+            updated_parsed = parse_date(feed['updated'])
+            if updated_parsed is not None:
+                feed['updated_parsed'] = updated_parsed
+
+    if root is None:
+        raise InvalidFeedFormat
+    return {'feed': feed, 'entries': entries, 'bozo': 0}
+
+
+def _entry_field(entry, tag, elem):
+    """
+    Set the feedparser style field of entry for the given child element,
+    keeping the first value found for each field.
+    """
+    if tag == 'link':
+        if elem.get('href') is not None:
+            if elem.get('rel', 'alternate') == 'alternate':
+                entry.setdefault('link', elem.get('href'))
+        elif elem.text:
+            entry.setdefault('link', elem.text.strip())
+        return
+    if tag in CONTENT_TAGS:
+        if 'content' not in entry:
+            entry['content'] = [{'value': _inner_text(elem)}]
+        return
+    text = (elem.text or '').strip()
+    if not text:
+        return
+    if tag in ('guid', 'id'):
+        entry.setdefault('id', text)
+    elif tag == 'title':
+        entry.setdefault('title', text)
+    elif tag in SUMMARY_TAGS:
+        entry.setdefault('summary', text)
+    elif tag in PUBLISHED_TAGS or tag in ENTRY_UPDATED_TAGS:
+        key = 'published' if tag in PUBLISHED_TAGS else 'updated'
+        if key not in entry:
+            entry[key] = text
+            parsed = parse_date(text)
+            if parsed is not None:
+                entry[key + '_parsed'] = parsed
+
+
+def _inner_text(elem):
+    return ((elem.text or '') + ''.join(
+        etree.tostring(child, encoding='unicode') for child in elem)).strip()
+
+
+def parse_date(value):
+    """
+    Parse an RFC 822 or ISO 8601 date into a UTC `time.struct_time`, or
+    return None.
+    """
+    parsed = parsedate_tz(value)
+    if parsed is not None:
+        try:
+            return time.gmtime(mktime_tz(parsed))
+        except (OverflowError, ValueError):
+            return None
+    match = ISO_DATE.match(value)
+    if match is None:
+        return None
+    year, month, day, hour, minute, second, tz = match.groups()
+    timestamp = calendar.timegm((int(year), int(month), int(day),
+                                 int(hour or 0), int(minute or 0),
+                                 int(second or 0), 0, 0, 0))
+    if tz and tz != 'Z':
+        offset = int(tz[1:3]) * 3600 + int(tz[-2:]) * 60
+        timestamp -= offset if tz[0] == '+' else -offset
+    return time.gmtime(timestamp)
+
+
+def _local_name(tag):
+    if not isinstance(tag, type('')):
+        return ''
+    return tag.rsplit('}', 1)[-1]
@@ -6,18 +6,27 @@ parsescrapegenerate.feed
 
 Feed related functions for ParseScrapeGenerate.
 """
+import atexit
+import hashlib
+import json
 import os
-import requests
+import threading
 import time
 
-from lxml import html
+from lxml import etree, html
 try:
-    from urllib.parse import urlparse
+    from urllib.parse import urljoin, urlparse
 except:
-    from urlparse import urlparse
+    from urlparse import urljoin, urlparse
 
+from .content import get_content_loader
 from .exceptions import FeedPathDoesNotExist, InvalidFeedFormat
-from .utils import get_clean_html, lazyattr, render_template
+from .fetcher import get_fetcher
+from .stats import bind, timed
+from .utils import (
+    compile_templates, get_clean_html, get_clean_html_list, get_xpath_plan,
+    lazyattr, render_template, stream_template
+)
 
 def get_feed(format='rss'):
     """
@@ -31,6 +40,10 @@ def get_feed(format='rss'):
 
 
 class AbstractFeed:
+    CLEAN_BATCH_SIZE = 64
+    MAX_PAGES = 10
+    PARALLEL_THRESHOLD = 500
+
     def __init__(self):
         if type(self) == 'AbstractFeed':
             raise Exception('AbstractFeed is abstract and cannot be instantiated.')
@@ -41,21 +54,73 @@ class AbstractFeed:
         self.link    = ''
         self.lang    = ''
         self.entries = []
+        self.fetcher = None
+        self.pagination = None
+        self.page_meta = {}
 
     @lazyattr
     def tree(self):
+        return self.load_tree(self.link)
+
+    @timed('tree')
+    def load_tree(self, path):
         tree = None
-        o = urlparse(self.link)
+        o = urlparse(path)
         if o.scheme in ['http', 'https']:
-            r = requests.get(self.link)
-            r.raise_for_status()
-            tree = html.fromstring(r.text)
+            tree = (self.fetcher or get_fetcher()).get_tree(path)
         else:
-            if not os.path.exists(self.link):
+            if not os.path.exists(path):
                 raise FeedPathDoesNotExist
-            tree = html.parse(self.link)
+            tree = html.parse(path)
         return tree
 
+    def iter_pages(self):
+        """
+        Yield the tree of each page, starting with the feed link and then
+        following the ``next`` query of the pagination config, for at most
+        ``max_pages`` pages. The next page is downloaded while the current
+        one is being processed.
+        """
+        pagination = self.pagination or {}
+        next_query = pagination.get('next')
+        max_pages = pagination.get('max_pages', self.MAX_PAGES)
+        if next_query:
+            next_query = etree.XPath(next_query)
+
+        path, tree = self.link, self.tree
+        if next_query is None or max_pages < 2:
+            yield tree
+            return
+
+        from concurrent.futures import ThreadPoolExecutor
+        seen = set([path])
+        pool = ThreadPoolExecutor(max_workers=1)
+        try:
+            for page in range(1, max_pages + 1):
+                future = None
+                next_path = None
+                if page < max_pages:
+                    next_path = self._next_page(tree, path, next_query)
+                if next_path and next_path not in seen:
+                    seen.add(next_path)
+                    future = pool.submit(bind(self.load_tree), next_path)
+                yield tree
+                if future is None:
+                    return
+                path, tree = next_path, future.result()
+        finally:
+            pool.shutdown(wait=False)
+
+    def _next_page(self, tree, path, next_query):
+        try:
+            href = next_query(tree)[0]
+        except (IndexError, etree.XPathError):
+            return None
+        if not isinstance(href, type(u'')):
+            href = href.get('href', '')
+        href = href.strip()
+        return urljoin(path, href) if href else None
+
     def fetch_val(self, attr, config, input_feed):
         if attr in config:
             return config[attr]
@@ -69,6 +134,8 @@ class AbstractFeed:
                 return ''
 
     def fetch_title(self):
+        if 'title' in self.page_meta:
+            return self.page_meta['title']
         try:
             title = self.tree.xpath('//title/text()')[0]
             return title.strip()
@@ -76,43 +143,239 @@ class AbstractFeed:
             return ''
 
     def fetch_lang(self):
+        if 'lang' in self.page_meta:
+            return self.page_meta['lang']
         try:
             lang = self.tree.xpath('/html/@lang')[0]
             return lang.strip()
         except:
             return ''
 
-    def fetch_entries(self, config, existing_ids=[]):
-        entries = []
-        templates = config.get('templates', [])
+    @timed('fetch_entries')
+    def fetch_entries(self, config, existing_ids=[], history=None):
+        return list(self.iter_entries(config, existing_ids, history))
+
+    def iter_entries(self, config, existing_ids=[], history=None):
+        """
+        Yield the entries found using the given entry config, skipping those
+        whose id is in existing_ids. Ids are worked out before the title and
+        content, see `entry_id`, so those of known entries are never
+        rendered. If the config sets ``stop_after_known``, no more entries
+        are looked at once that many known entries are found in a row.
+
+        If the feed has a pagination config, following pages are scraped too,
+        until a page has only known entries or ``max_entries`` new entries
+        have been found.
+
+        If the config sets ``stream``, the page is parsed incrementally and
+        finished entries are discarded, so memory use does not grow with the
+        size of the page. Otherwise, if the config sets ``workers``, pages
+        with at least ``parallel_threshold`` entries are extracted on a pool
+        of that many processes.
+
+        New entries are all dated with the time the scrape started, so that
+        they keep their document order when merged by date.
+        """
+        now = self.get_date()
+        templates = compile_templates(config.get('templates', {}))
+        plan = get_xpath_plan(config['xpath'])
+        loader = get_content_loader(config, self.fetcher)
+
+        if config.get('stream'):
+            batches = self.stream_rows(plan)
+        else:
+            batches = (self.extract_page_rows(plan.context(tree), plan, config)
+                       for tree in self.iter_pages())
+
+        max_entries = (self.pagination or {}).get('max_entries')
+        stop_after = config.get('stop_after_known')
+        known = 0
+        count = 0
+        for rows in batches:
+            new_rows = []
+            for vals in rows:
+                context = {'entry': vals, 'get_content': loader}
+                entry = Entry()
+                setattr(entry, 'link', entry.get_val('link', templates, vals, context))
+                setattr(entry, 'published', now)
+                setattr(entry, 'id', self.entry_id(entry, config, templates,
+                                                   vals, context, history))
+
+                if entry.id in existing_ids:
+                    known += 1
+                    if stop_after and known >= stop_after:
+                        break
+                    continue
+                known = 0
+                new_rows.append((entry, vals, context))
+
+            if max_entries:
+                new_rows = new_rows[:max_entries - count]
+
+            if config.get('prefetch') or hasattr(self.fetcher, 'prefetch'):
+                loader.prefetch(loader.find_calls(
+                    templates, [vals for _, vals, _ in new_rows]))
+
+            for entry, vals, context in new_rows:
+                setattr(entry, 'title', entry.get_val('title', templates, vals, context))
+                setattr(entry, 'content', entry.get_val('content', templates, vals, context))
+                count += 1
+                yield entry
+
+            if stop_after and known >= stop_after:
+                return
+            if max_entries and count >= max_entries:
+                return
+            if self.pagination and rows and not new_rows:
+                return
+
+    def entry_id(self, entry, config, templates, vals, context=None,
+                 history=None):
+        """
+        Return the id of entry. An ``id`` template or XPath rule is used if
+        the entry config has one. Otherwise the ``id_scheme`` applies:
+        ``url`` and ``content`` hash the link or the extracted vals, and
+        ``tag``, the default, builds a tag URI from the link and the date it
+        was first seen. If history, an `state.EntryHistory`, has an entry
+        with the same link, its id and date are reused.
+        """
+        entry_id = entry.get_val('id', templates, vals, context)
+        if entry_id:
+            return entry_id
+        scheme = config.get('id_scheme', 'tag')
+        if scheme == 'url':
+            return _hash_id(entry.link)
+        if scheme == 'content':
+            return _hash_id(json.dumps(vals, sort_keys=True))
+        previous = history.get(entry.link) if history and entry.link else None
+        if previous is not None:
+            entry_id, first_seen = previous
+            if first_seen is not None:
+                entry.published = self.get_date(time.gmtime(first_seen))
+            return entry_id
+        return entry.generate_tag(self.DATE_FORMAT)
 
-        # try:
-        for node in self.tree.xpath(config['xpath']['context']):
-            vals = {}
-            for key, value in config['xpath'].items():
-                if key == 'context':
+    def stream_rows(self, plan):
+        """
+        Incrementally parse the page, yielding batches of extracted vals.
+        Field queries only see the context element, and elements are cleared
+        once extracted. The page title and lang are kept in page_meta, so
+        the page never has to be parsed into a tree. Pages downloaded with a
+        charset in their Content-Type header are parsed with it.
+        """
+        o = urlparse(self.link)
+        if o.scheme in ['http', 'https']:
+            source = (self.fetcher or get_fetcher()).open(self.link)
+        else:
+            if not os.path.exists(self.link):
+                raise FeedPathDoesNotExist
+            source = open(self.link, 'rb')
+        try:
+            nodes = []
+            try:
+                events = etree.iterparse(source, events=('end',), html=True,
+                                         encoding=getattr(source, 'charset',
+                                                          None))
+            except LookupError:
+                events = etree.iterparse(source, events=('end',), html=True)
+            for event, elem in events:
+                if 'lang' not in self.page_meta:
+                    root = elem.getroottree().getroot()
+                    self.page_meta['lang'] = (root.get('lang', '').strip()
+                                              if root.tag == 'html' else '')
+                if elem.tag == 'title' and 'title' not in self.page_meta:
+                    self.page_meta['title'] = (elem.text or '').strip()
+                if not plan.match(elem):
                     continue
-                try:
-                    elem = node.xpath(value)[0]
-                    vals[key] = get_clean_html(elem)
-                except Exception as e:
-                    vals[key] = ''
-
-            entry = Entry()
-            setattr(entry, 'title', entry.get_val('title', templates, vals))
-            setattr(entry, 'link', entry.get_val('link', templates, vals))
-            setattr(entry, 'content', entry.get_val('content', templates, vals))
-            setattr(entry, 'published', self.get_date())
-            setattr(entry, 'id', entry.generate_tag(self.DATE_FORMAT))
-
-            if not entry.id in existing_ids:
-                entries.append(entry)
-        # except Exception as e:
-        #     pass
-
-        return entries
-
-    def get_date(self, time_struct=time.gmtime()):
+                nodes.append(elem)
+                if len(nodes) >= self.CLEAN_BATCH_SIZE:
+                    yield self._extract_and_clear(nodes, plan)
+                    nodes = []
+            if nodes:
+                yield self._extract_and_clear(nodes, plan)
+        finally:
+            source.close()
+            self.page_meta.setdefault('title', '')
+            self.page_meta.setdefault('lang', '')
+
+    def _extract_and_clear(self, nodes, plan):
+        rows = self.extract_rows(nodes, plan)
+        for node in nodes:
+            node.clear()
+            parent = node.getparent()
+            while parent is not None and node.getprevious() is not None:
+                del parent[0]
+        return rows
+
+    def extract_page_rows(self, nodes, plan, config):
+        """
+        Extract the vals of each of the given context nodes, in parallel if
+        the config sets more than one ``workers`` and there are at least
+        ``parallel_threshold`` nodes.
+        """
+        workers = config.get('workers') or 1
+        threshold = config.get('parallel_threshold', self.PARALLEL_THRESHOLD)
+        if workers > 1 and len(nodes) >= max(threshold, 2):
+            return self.extract_rows_parallel(nodes, config['xpath'], workers)
+        return self.extract_rows(nodes, plan)
+
+    @timed('extract_parallel')
+    def extract_rows_parallel(self, nodes, xpath_config, workers):
+        """
+        Extract the vals of each of the given context nodes on a pool of
+        workers processes. The nodes are serialized and split into chunks,
+        one or more per worker, and the rows are returned in document order.
+        Field queries only see the context element.
+        """
+        fragments = [etree.tostring(node, method='xml', encoding='unicode',
+                                    with_tail=False) for node in nodes]
+        size = max(self.CLEAN_BATCH_SIZE,
+                   -(-len(fragments) // (workers * 4)))
+        chunks = [fragments[start:start + size]
+                  for start in range(0, len(fragments), size)]
+        pool = get_process_pool(workers)
+        rows = []
+        for chunk_rows in pool.map(_extract_fragments,
+                                   [xpath_config] * len(chunks), chunks):
+            rows.extend(chunk_rows)
+        return rows
+
+    def extract_vals(self, node, plan):
+        return self.extract_rows([node], plan)[0]
+
+    @timed('extract')
+    def extract_rows(self, nodes, plan):
+        """
+        Extract the vals of each of the given context nodes. The matched
+        fields of up to CLEAN_BATCH_SIZE nodes are cleaned together.
+        """
+        rows = []
+        for start in range(0, len(nodes), self.CLEAN_BATCH_SIZE):
+            batch = []
+            for node in nodes[start:start + self.CLEAN_BATCH_SIZE]:
+                vals = {}
+                for key, query in plan.fields:
+                    try:
+                        batch.append((vals, key, query(node)[0]))
+                    except Exception as e:
+                        vals[key] = ''
+                rows.append(vals)
+            try:
+                cleaned = get_clean_html_list([elem for _, _, elem in batch])
+            except Exception as e:
+                cleaned = []
+                for _, _, elem in batch:
+                    try:
+                        cleaned.append(get_clean_html(elem))
+                    except Exception as e:
+                        cleaned.append('')
+            for (vals, key, _), val in zip(batch, cleaned):
+                vals[key] = val
+        return rows
+
+    def get_date(self, time_struct=None):
+        if time_struct is None:
+            time_struct = time.gmtime()
         try:
             return time.strftime(self.DATE_FORMAT, time_struct)
         except Exception as e:
@@ -121,6 +384,62 @@ class AbstractFeed:
     def xml(self):
         return render_template(self.TEMPLATE_FILE, {'feed': self})
 
+    def xml_stream(self):
+        return stream_template(self.TEMPLATE_FILE, {'feed': self})
+
+
+def _hash_id(value):
+    return 'urn:sha1:' + hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+
+def _extract_fragments(xpath_config, fragments):
+    """
+    Process pool worker for `AbstractFeed.extract_rows_parallel`.
+    """
+    parser = html.XHTMLParser()
+    nodes = [etree.fromstring(fragment, parser) for fragment in fragments]
+    return RssFeed().extract_rows(nodes, get_xpath_plan(xpath_config))
+
+
+_process_pools = {}
+_process_pools_lock = threading.Lock()
+
+def get_process_pool(workers):
+    """
+    Return the shared process pool with the given number of workers,
+    starting it on first use. Workers are started by a forkserver, or
+    spawned where there is none, rather than forked, as forking a process
+    with other threads running could copy a lock that one of them holds.
+    Pools are shut down at exit.
+    """
+    with _process_pools_lock:
+        pool = _process_pools.get(workers)
+        if pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            kwargs = {}
+            if hasattr(multiprocessing, 'get_context'):
+                method = 'spawn'
+                if 'forkserver' in multiprocessing.get_all_start_methods():
+                    method = 'forkserver'
+                kwargs['mp_context'] = multiprocessing.get_context(method)
+            pool = _process_pools[workers] = ProcessPoolExecutor(workers,
+                                                                 **kwargs)
+    return pool
+
+
+def shutdown_process_pools():
+    """
+    Shut down the shared process pools.
+    """
+    with _process_pools_lock:
+        pools = list(_process_pools.values())
+        _process_pools.clear()
+    for pool in pools:
+        pool.shutdown()
+
+atexit.register(shutdown_process_pools)
+
 
 class AtomFeed(AbstractFeed):
     DATE_FORMAT='%Y-%m-%dT%H:%M:%SZ'
@@ -132,7 +451,9 @@ class RssFeed(AbstractFeed):
     TEMPLATE_FILE='rss.xml'
 
 
-class Entry:
+class Entry(object):
+    __slots__ = ('id', 'title', 'updated', 'published', 'link', 'content')
+
     def __init__(self):
         self.id        = ''
         self.title     = ''
@@ -151,10 +472,75 @@ class Entry:
         except Exception as e:
             return ''
 
-    def get_val(self, attr, templates, vals):
+    def get_val(self, attr, templates, vals, context=None):
         if attr in templates:
-            return render_template(templates[attr], {'entry': vals})
+            return render_template(templates[attr], context or {'entry': vals})
         elif attr in vals:
             return vals[attr]
         else:
             return ''
+
+
+class EntryBatch(object):
+    """
+    Columnar store of entries, with one list per `Entry` field. Indexing or
+    iterating returns `EntryView` rows, created on access, so holding many
+    entries costs a few list slots each rather than an object apiece.
+    """
+    FIELDS = Entry.__slots__
+
+    def __init__(self, entries=()):
+        self.columns = dict((field, []) for field in self.FIELDS)
+        self.extend(entries)
+
+    def append(self, entry):
+        for field in self.FIELDS:
+            self.columns[field].append(getattr(entry, field, ''))
+
+    def extend(self, entries):
+        for entry in entries:
+            self.append(entry)
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return EntryBatch(self[i] for i in range(*index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return EntryView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield EntryView(self, index)
+
+
+def _column(field):
+    def get(self):
+        return self.batch.columns[field][self.index]
+
+    def set(self, value):
+        self.batch.columns[field][self.index] = value
+
+    return property(get, set)
+
+
+class EntryView(object):
+    """
+    A row of an `EntryBatch`, with the same attributes as `Entry`.
+    """
+    __slots__ = ('batch', 'index')
+
+    def __init__(self, batch, index):
+        self.batch = batch
+        self.index = index
+
+    id        = _column('id')
+    title     = _column('title')
+    updated   = _column('updated')
+    published = _column('published')
+    link      = _column('link')
+    content   = _column('content')
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+
+"""
+parsescrapegenerate.fetcher
+---------------------------
+
+HTTP fetching for ParseScrapeGenerate.
+"""
+import codecs
+import json
+import re
+import threading
+
+from lxml import etree, html
+
+from . import __title__, __version__
+from .cache import HttpCache
+from .exceptions import ConfigIsNotValid, PageTooLarge
+from .stats import incr, timer
+
+HTTP_SETTINGS = (
+    'timeout', 'retries', 'backoff', 'pool_size', 'user_agent', 'cache',
+    'max_page_size'
+)
+
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_POOL_SIZE = 10
+RETRY_STATUSES = (500, 502, 503, 504)
+CHUNK_SIZE = 64 * 1024
+META_CHARSET = re.compile(
+    br'<meta[^>]+charset\s*=\s*["\']?\s*([-\w.:]+)', re.IGNORECASE)
+
+class Fetcher(object):
+    """
+    Wraps a pooled `requests.Session` with keep-alive, timeouts, and retry
+    with backoff on connection errors and 5xx responses. If given an
+    `cache.HttpCache`, bodies are cached and revalidated with conditional
+    requests.
+    """
+    def __init__(self, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, pool_size=DEFAULT_POOL_SIZE,
+                 user_agent=None, cache=None, max_page_size=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+        try:
+            from urllib3.util.retry import Retry
+        except ImportError:
+            from requests.packages.urllib3.util.retry import Retry
+
+        self.timeout = (connect_timeout, read_timeout)
+        self.cache = cache
+        self.max_page_size = max_page_size
+        retry = Retry(total=retries, connect=retries, read=retries,
+                      status=retries, backoff_factor=backoff,
+                      status_forcelist=RETRY_STATUSES, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['User-Agent'] = (
+            user_agent or '{0}/{1}'.format(__title__, __version__))
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Create a fetcher from the ``http`` section of a feed config.
+        """
+        return cls(**fetcher_options(settings))
+
+    def get(self, url, **kwargs):
+        """
+        GET the given URL, raising `requests.HTTPError` on an error status.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        incr('http.requests')
+        with timer('http'):
+            r = self.session.get(url, **kwargs)
+        r.raise_for_status()
+        return r
+
+    def get_cached(self, url):
+        """
+        GET the given URL through the cache, returning a
+        `cache.CachedResponse`. Fresh responses are returned without a
+        request; stale ones are revalidated with a conditional GET.
+        """
+        cached = self.cache.get(url)
+        if cached is not None and cached.is_fresh(self.cache.ttl):
+            incr('http.cache_hits')
+            return cached
+        headers = cached.conditional_headers() if cached is not None else {}
+        r = self.get(url, headers=headers)
+        if r.status_code == 304 and cached is not None:
+            incr('http.not_modified')
+            return self.cache.touch(url) or cached
+        incr('http.bytes', len(r.content))
+        return self.cache.set(url, r.content, r.headers,
+                              get_charset(r.headers))
+
+    def get_text(self, url):
+        """
+        GET the given URL and return the decoded body.
+        """
+        if self.cache is not None:
+            return self.get_cached(url).text
+        r = self.get(url)
+        incr('http.bytes', len(r.content))
+        return decode_html(r.content, get_charset(r.headers))
+
+    def get_tree(self, url):
+        """
+        GET the given URL and parse it as HTML, returning the root element.
+        The raw body is fed to the parser as it downloads, with the charset
+        from the Content-Type header as a hint, and gzip or deflate transport
+        encodings are decoded on the fly. Raises `exceptions.PageTooLarge` if
+        the body exceeds max_page_size bytes.
+        """
+        if self.cache is not None:
+            cached = self.get_cached(url)
+            self._check_size(url, len(cached.content))
+            return parse_html([cached.content], cached.charset)
+        r = self.get(url, stream=True)
+        try:
+            self._check_size(url, int(r.headers.get('Content-Length') or 0))
+            return parse_html(self._iter_limited(url, r),
+                              get_charset(r.headers))
+        finally:
+            r.close()
+
+    def open(self, url):
+        """
+        GET the given URL without reading the body, returning a file-like
+        object that reads the decoded body and raises
+        `exceptions.PageTooLarge` past max_page_size bytes. Its charset is
+        that of the Content-Type header, if any. The caller must close it.
+        """
+        r = self.get(url, stream=True)
+        self._check_size(url, int(r.headers.get('Content-Length') or 0))
+        r.raw.decode_content = True
+        return _LimitedReader(self, url, r)
+
+    def _iter_limited(self, url, r):
+        size = 0
+        for chunk in r.iter_content(CHUNK_SIZE):
+            size += len(chunk)
+            incr('http.bytes', len(chunk))
+            self._check_size(url, size)
+            yield chunk
+
+    def _check_size(self, url, size):
+        if self.max_page_size and size > self.max_page_size:
+            raise PageTooLarge(
+                "{0} is larger than {1} bytes".format(url, self.max_page_size))
+
+    def close(self):
+        self.session.close()
+
+
+class _LimitedReader(object):
+    def __init__(self, fetcher, url, response):
+        self.fetcher = fetcher
+        self.url = url
+        self.response = response
+        self.charset = get_charset(response.headers)
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.response.raw.read(size if size >= 0 else None)
+        self.size += len(data)
+        incr('http.bytes', len(data))
+        self.fetcher._check_size(self.url, self.size)
+        return data
+
+    def close(self):
+        self.response.close()
+
+
+def fetcher_options(settings):
+    """
+    Return the keyword arguments of a fetcher for the given ``http`` section
+    of a feed config.
+    """
+    settings = settings or {}
+    unknown = set(settings) - set(HTTP_SETTINGS)
+    if unknown:
+        raise ConfigIsNotValid(
+            "Unknown http setting: {0}".format(', '.join(sorted(unknown))))
+    timeout = settings.get('timeout', {})
+    if isinstance(timeout, dict):
+        connect = timeout.get('connect', DEFAULT_CONNECT_TIMEOUT)
+        read = timeout.get('read', DEFAULT_READ_TIMEOUT)
+    else:
+        connect = read = timeout
+    cache = settings.get('cache')
+    if cache:
+        if not isinstance(cache, dict) or 'dir' not in cache:
+            raise ConfigIsNotValid("http cache requires a dir")
+        cache = HttpCache(cache['dir'], cache.get('max_size'),
+                          cache.get('ttl'))
+    return {
+        'connect_timeout': connect,
+        'read_timeout': read,
+        'retries': settings.get('retries', DEFAULT_RETRIES),
+        'backoff': settings.get('backoff', DEFAULT_BACKOFF),
+        'pool_size': settings.get('pool_size', DEFAULT_POOL_SIZE),
+        'user_agent': settings.get('user_agent'),
+        'cache': cache,
+        'max_page_size': settings.get('max_page_size'),
+    }
+
+
+def get_charset(headers):
+    """
+    Return the charset parameter of the Content-Type header, if any.
+    """
+    for param in headers.get('Content-Type', '').split(';')[1:]:
+        name, _, value = param.partition('=')
+        if name.strip().lower() == 'charset':
+            return value.strip().strip('"\'') or None
+    return None
+
+
+def decode_html(body, charset=None):
+    """
+    Decode an HTML body using the given charset from the Content-Type
+    header, or else a byte order mark or the charset declared by a meta
+    tag, as the HTML parser would. Falls back to UTF-8, then Windows-1252.
+    """
+    if not charset:
+        if body.startswith(codecs.BOM_UTF8):
+            charset = 'utf-8-sig'
+        else:
+            match = META_CHARSET.search(body[:4096])
+            if match is not None:
+                charset = match.group(1).decode('ascii')
+    if charset:
+        try:
+            return body.decode(charset, 'replace')
+        except LookupError:
+            pass
+    try:
+        return body.decode('utf-8')
+    except UnicodeDecodeError:
+        return body.decode('cp1252', 'replace')
+
+
+def parse_html(chunks, encoding=None):
+    """
+    Incrementally parse the given chunks of HTML bytes, returning the root
+    element.
+    """
+    try:
+        parser = html.HTMLParser(encoding=encoding)
+    except LookupError:
+        parser = html.HTMLParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    root = parser.close()
+    if root is None:
+        raise etree.ParserError("Document is empty")
+    return root
+
+
+class LazyFetcher(object):
+    """
+    Stands in for the shared `Fetcher` for the given settings, which is only
+    looked up, and requests imported, once a request is made.
+    """
+    def __init__(self, settings=None):
+        self.settings = settings
+        self._fetcher = None
+
+    @property
+    def fetcher(self):
+        if self._fetcher is None:
+            self._fetcher = get_fetcher(self.settings)
+        return self._fetcher
+
+    def get_text(self, url):
+        return self.fetcher.get_text(url)
+
+    def get_tree(self, url):
+        return self.fetcher.get_tree(url)
+
+    def open(self, url):
+        return self.fetcher.open(url)
+
+
+_fetchers = {}
+_fetchers_lock = threading.Lock()
+
+def get_fetcher(settings=None):
+    """
+    Return the shared `Fetcher` for the given settings, creating it on first
+    use. Feeds with the same settings share connection pools.
+    """
+    key = json.dumps(settings or {}, sort_keys=True)
+    with _fetchers_lock:
+        fetcher = _fetchers.get(key)
+        if fetcher is None:
+            fetcher = _fetchers[key] = Fetcher.from_settings(settings)
+    return fetcher
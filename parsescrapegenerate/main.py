@@ -6,42 +6,125 @@ parsescrapegenerate.main
 
 Main entry point for ParseScrapeGenerate.
 """
-import feedparser
+import hashlib
+import json
+import os
 import time
+import warnings
+
+from xml.sax.saxutils import escape
 
 from . import __title__, __version__
-from .feed import get_feed
+from .exceptions import InvalidFeedFormat
+from .feed import EntryBatch, get_feed
+from .fetcher import LazyFetcher
+from .merge import from_input_entries, from_scraped, merge_entries
+from .state import DAY, EntryHistory, KnownIds, get_seen_store
+from .stats import collect, emit, timed, timer
+from .utils import write_atomic
 
-def parse(feed):
+@timed('parse')
+def parse(feed, fast=False):
     """
-    Parse the given feed.
+    Parse the given feed. If fast is set and feed is an RSS or Atom document,
+    only the parts `scrape` needs are extracted; anything else, including
+    malformed documents, falls back to feedparser.
     """
+    if fast and feed.lstrip()[:1] in ('<', b'<'):
+        from lxml.etree import XMLSyntaxError
+        from .fastparse import parse as fast_parse
+        try:
+            return fast_parse(feed)
+        except (InvalidFeedFormat, XMLSyntaxError):
+            pass
+    import feedparser
     return feedparser.parse(feed)
 
 
-def scrape(feed_config, input_feed={}):
+def scrape(feed_config, input_feed={}, fetcher=None):
     """
     Scrape the link from the feed config, using the defined rules to extract
     entries. If an optional input feed is given, extract the entries from it
-    and add them to the resulting scraped feed.
+    and add them to the resulting scraped feed, newest first. The config may
+    cap the merged entries with ``max_entries`` and ``max_age_days``.
+
+    Pages are downloaded with the given fetcher, or the shared
+    `fetcher.Fetcher` for the config's ``http`` settings, which is only
+    created if anything is downloaded.
+
+    Entries known from the ``state`` store are skipped like those of the
+    input feed, but only the input feed has their content, so a warning is
+    issued if any are skipped when no input feed is given.
+
+    The stats hooks are called with a report of this scrape alone, with its
+    ``path`` under the ``feed`` key.
     """
+    with collect() as scrape_stats:
+        feed = _scrape(feed_config, input_feed, fetcher)
+    scrape_report = scrape_stats.report()
+    scrape_report['feed'] = feed_config['path']
+    emit(scrape_report)
+    return feed
+
+
+def _scrape(feed_config, input_feed, fetcher):
     if 'format' in feed_config:
         format = feed_config['format']
     else:
         format = 'rss'
 
-    entry_tags = []
+    entry_tags = set()
     input_entries = input_feed.get('entries', [])
     for entry in input_entries:
-        entry_tags.append(entry['id'])
+        if entry.get('id'):
+            entry_tags.add(escape(entry['id']))
+
+    store = get_seen_store(feed_config)
+    known_ids = entry_tags
+    if store is not None:
+        known_ids = KnownIds(entry_tags, store)
+    history = EntryHistory(input_entries, store)
 
     feed = get_feed(format)
     feed.generator = '{0} {1}'.format(__title__, __version__)
     feed.link = feed_config['path']
+    feed.fetcher = fetcher or LazyFetcher(feed_config.get('http'))
+    feed.pagination = feed_config.get('pagination')
+    try:
+        with timer('fetch_entries'):
+            new_entries = EntryBatch(
+                feed.iter_entries(feed_config['entry'], known_ids, history))
+        if store is not None:
+            store.add(list(entry_tags) + known_ids.hits +
+                      [entry.id for entry in new_entries])
+            store.add_links((entry.link, entry.id) for entry in new_entries)
+            if known_ids.hits and not input_entries:
+                warnings.warn(
+                    "{0} known entries of {1} were left out, as no existing "
+                    "feed was given".format(len(known_ids.hits),
+                                            feed_config['path']))
+            retention = feed_config['state'].get('retention_days')
+            if retention:
+                store.prune(retention)
+    finally:
+        if store is not None:
+            store.close()
+
+    # Fetched after the entries, so that a streamed page can supply them.
     feed.title = feed.fetch_val('title', feed_config, input_feed.get('feed', {}))
     feed.lang = feed.fetch_val('lang', feed_config, input_feed.get('feed', {}))
-    feed.entries = feed.fetch_entries(feed_config['entry'], entry_tags)
-    if len(feed.entries) > len(entry_tags):
+
+    date_format = feed.DATE_FORMAT
+    max_age_days = feed_config.get('max_age_days')
+    with timer('merge'):
+        feed.entries = EntryBatch(merge_entries(
+            [(from_scraped(entry, date_format) for entry in new_entries),
+             from_input_entries(input_entries, date_format,
+                                [entry.id for entry in new_entries])],
+            feed_config.get('max_entries'),
+            time.time() - max_age_days * DAY if max_age_days else None))
+
+    if len(new_entries):
         time_struct=time.gmtime()
     else:
         try:
@@ -53,8 +136,60 @@ def scrape(feed_config, input_feed={}):
     return feed
 
 
-def generate(feed):
+def generate(feed, stream=False):
     """
-    Return the given feed object as XML.
+    Return the given feed object as XML. If stream is set, return an iterator
+    of XML chunks instead, so the whole document is never held in memory.
     """
+    if stream:
+        return feed.xml_stream()
     return feed.xml()
+
+
+def write(feed, out):
+    """
+    Write the given feed object as XML to the file-like object out.
+    """
+    for chunk in generate(feed, stream=True):
+        out.write(chunk)
+
+
+def digest(feed):
+    """
+    Return a hash of the given feed's metadata and entries, leaving out its
+    updated date, so that it only changes when the content does.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps([feed.TEMPLATE_FILE, feed.title, feed.link,
+                         feed.lang]).encode('utf-8'))
+    for entry in feed.entries:
+        h.update(json.dumps([entry.id, entry.title, entry.link,
+                             entry.published, entry.content]).encode('utf-8'))
+    return h.hexdigest()
+
+
+def write_file(feed, path, compress=False):
+    """
+    Write the given feed object as XML to path, unless its `digest` is the
+    one saved alongside it, at path + '.sha256', by the last write. Returns
+    whether the file was written. Files are written atomically, and if
+    compress is set, a gzipped copy is written to path + '.gz'.
+    """
+    digest_path = path + '.sha256'
+    paths = [path, path + '.gz'] if compress else [path]
+    new_digest = digest(feed)
+    try:
+        with open(digest_path) as f:
+            old_digest = f.read().strip()
+    except (IOError, OSError):
+        old_digest = None
+    if old_digest == new_digest and all(os.path.exists(p) for p in paths):
+        return False
+
+    write_atomic(path, generate(feed, stream=True))
+    if compress:
+        with open(path, 'rb') as f:
+            write_atomic(path + '.gz', iter(lambda: f.read(64 * 1024), b''),
+                         compress=True)
+    write_atomic(digest_path, new_digest + '\n')
+    return True
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+"""
+parsescrapegenerate.merge
+-------------------------
+
+Merging of newly scraped entries with the entries of the existing feed.
+"""
+import calendar
+import heapq
+import time
+
+from xml.sax.saxutils import escape
+
+from .feed import Entry
+
+def from_input(item, date_format):
+    """
+    Return a (timestamp, `feed.Entry`) pair for the given feedparser style
+    entry dict. The timestamp is None if the entry has no parsable date.
+
+    The id, title and link are escaped, as those of scraped entries are, so
+    that they are written back as they were read.
+    """
+    entry = Entry()
+    entry.id = escape(item.get('id', ''))
+    entry.title = escape(item.get('title', ''))
+    entry.link = escape(item.get('link', ''))
+    content = item.get('content')
+    if content:
+        entry.content = content[0].get('value', '')
+    else:
+        entry.content = item.get('summary', '')
+    parsed = item.get('published_parsed') or item.get('updated_parsed')
+    if parsed:
+        entry.published = time.strftime(date_format, parsed)
+        return calendar.timegm(parsed), entry
+    entry.published = item.get('published') or item.get('updated') or ''
+    return None, entry
+
+
+def from_input_entries(items, date_format, exclude_ids=()):
+    """
+    Yield a (timestamp, `feed.Entry`) pair for each of the given feedparser
+    style entry dicts, skipping those whose id is in exclude_ids or was
+    already seen.
+    """
+    seen = set(exclude_ids)
+    for item in items:
+        entry_id = escape(item.get('id', ''))
+        if entry_id:
+            if entry_id in seen:
+                continue
+            seen.add(entry_id)
+        yield from_input(item, date_format)
+
+
+def from_scraped(entry, date_format):
+    """
+    Return a (timestamp, entry) pair for the given scraped `feed.Entry`,
+    whose published date is in date_format.
+    """
+    try:
+        return calendar.timegm(time.strptime(entry.published,
+                                             date_format)), entry
+    except (TypeError, ValueError):
+        return None, entry
+
+
+def merge_entries(sources, max_entries=None, newer_than=None):
+    """
+    Yield the entries of the given sources, iterables of (timestamp, entry)
+    pairs, newest first. Each source is split into runs that are already in
+    order, and the runs are merged with a heap, so n entries in k runs take
+    O(n log k) rather than a full sort. Entries without a timestamp come
+    last, and ties keep the order of the sources.
+
+    Stops after max_entries entries, or at the first entry older than
+    newer_than.
+    """
+    runs = []
+    for source in sources:
+        runs.extend(_runs(source))
+    heap = [(run[0][0], i, 0) for i, run in enumerate(runs)]
+    heapq.heapify(heap)
+
+    count = 0
+    while heap:
+        key, i, position = heap[0]
+        entry = runs[i][position][1]
+        if position + 1 < len(runs[i]):
+            heapq.heapreplace(heap, (runs[i][position + 1][0], i,
+                                     position + 1))
+        else:
+            heapq.heappop(heap)
+        if newer_than is not None and key > -newer_than:
+            return
+        yield entry
+        count += 1
+        if max_entries and count >= max_entries:
+            return
+
+
+def _runs(source):
+    """
+    Split source into lists of (key, entry) pairs in ascending key order,
+    where the key sorts newer entries first.
+    """
+    runs = []
+    run = []
+    for timestamp, entry in source:
+        key = -timestamp if timestamp is not None else float('inf')
+        if run and key < run[-1][0]:
+            runs.append(run)
+            run = []
+        run.append((key, entry))
+    if run:
+        runs.append(run)
+    return runs
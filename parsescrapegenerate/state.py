@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+"""
+parsescrapegenerate.state
+-------------------------
+
+Persistent per-feed state for ParseScrapeGenerate.
+"""
+import calendar
+import hashlib
+import os
+import threading
+import time
+
+from xml.sax.saxutils import escape
+
+from .exceptions import ConfigIsNotValid
+
+DAY = 24 * 60 * 60
+
+class SeenStore(object):
+    """
+    SQLite backed record of the entry ids a feed has produced, along with
+    when each was first and last seen.
+    """
+    def __init__(self, path):
+        import sqlite3
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS seen ('
+                'id TEXT PRIMARY KEY, first_seen REAL, last_seen REAL)')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS links ('
+                'link TEXT PRIMARY KEY, id TEXT)')
+
+    def __contains__(self, entry_id):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT 1 FROM seen WHERE id = ?', (entry_id,)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM seen').fetchone()[0]
+
+    def add(self, ids, now=None):
+        """
+        Record the given ids as seen now, keeping the first_seen time of ids
+        that were already known.
+        """
+        now = time.time() if now is None else now
+        rows = [(entry_id, now, now) for entry_id in ids if entry_id]
+        with self._lock, self._db:
+            self._db.executemany(
+                'INSERT OR IGNORE INTO seen VALUES (?, ?, ?)', rows)
+            self._db.executemany(
+                'UPDATE seen SET last_seen = ? WHERE id = ?',
+                [(now, row[0]) for row in rows])
+
+    def add_links(self, pairs):
+        """
+        Record the id given to each of the (link, id) pairs, keeping the
+        first id recorded for a link.
+        """
+        rows = [(link, entry_id) for link, entry_id in pairs
+                if link and entry_id]
+        with self._lock, self._db:
+            self._db.executemany('INSERT OR IGNORE INTO links VALUES (?, ?)',
+                                 rows)
+
+    def get_link(self, link):
+        """
+        Return the (id, first_seen) recorded for link, or None.
+        """
+        with self._lock:
+            return self._db.execute(
+                'SELECT links.id, seen.first_seen FROM links '
+                'JOIN seen ON seen.id = links.id WHERE link = ?',
+                (link,)).fetchone()
+
+    def prune(self, retention_days, now=None):
+        """
+        Forget ids that have not been seen in retention_days.
+        """
+        now = time.time() if now is None else now
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM seen WHERE last_seen < ?',
+                             (now - retention_days * DAY,))
+            self._db.execute(
+                'DELETE FROM links WHERE id NOT IN (SELECT id FROM seen)')
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class KnownIds(object):
+    """
+    Membership test over a set of ids plus a `SeenStore`. Ids found only in
+    the store are collected in hits, so they can be marked as seen again.
+    """
+    def __init__(self, ids, store):
+        self.ids = ids
+        self.store = store
+        self.hits = []
+
+    def __contains__(self, entry_id):
+        if entry_id in self.ids:
+            return True
+        if entry_id in self.store:
+            self.hits.append(entry_id)
+            return True
+        return False
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class EntryHistory(object):
+    """
+    The id and first seen time of the entries a feed has produced, by link,
+    from the entries of the existing feed and the `SeenStore`, if any.
+    """
+    def __init__(self, items=(), store=None):
+        self.links = {}
+        self.store = store
+        for item in items:
+            link, entry_id = item.get('link'), item.get('id')
+            if link and entry_id:
+                link, entry_id = escape(link), escape(entry_id)
+            if link and entry_id and link not in self.links:
+                parsed = (item.get('published_parsed') or
+                          item.get('updated_parsed'))
+                self.links[link] = (
+                    entry_id, calendar.timegm(parsed) if parsed else None)
+
+    def get(self, link):
+        """
+        Return the (id, first_seen) of the entry with the given link, or
+        None. first_seen is None if the entry's date is not known.
+        """
+        if link in self.links:
+            return self.links[link]
+        if self.store is not None:
+            return self.store.get_link(link)
+        return None
+
+
+def get_seen_store(feed_config):
+    """
+    Return the `SeenStore` for the given feed config, or None if it does not
+    define a ``state`` dir. Each feed ``path`` gets its own database.
+    """
+    state = feed_config.get('state')
+    if not state:
+        return None
+    if not isinstance(state, dict) or 'dir' not in state:
+        raise ConfigIsNotValid("state requires a dir")
+    directory = os.path.expanduser(state['dir'])
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    key = hashlib.sha1(feed_config['path'].encode('utf-8')).hexdigest()
+    return SeenStore(os.path.join(directory, key + '.sqlite'))
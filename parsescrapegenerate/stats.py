@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+"""
+parsescrapegenerate.stats
+-------------------------
+
+Process-wide and per-scrape timing and counters for the stages of a scrape.
+"""
+import functools
+import random
+import threading
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+
+MAX_SAMPLES = 10000
+PERCENTILES = (50, 90, 99)
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+class Stats(object):
+    """
+    Collects call counts and durations per stage, along with arbitrary
+    counters. Percentiles are computed from at most MAX_SAMPLES durations
+    per stage, sampled uniformly.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hooks = []
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counts = defaultdict(int)
+            self._totals = defaultdict(float)
+            self._samples = defaultdict(list)
+            self._counters = defaultdict(int)
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._counts[name] += 1
+            self._totals[name] += seconds
+            samples = self._samples[name]
+            if len(samples) < MAX_SAMPLES:
+                samples.append(seconds)
+            else:
+                i = random.randrange(self._counts[name])
+                if i < MAX_SAMPLES:
+                    samples[i] = seconds
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    @contextmanager
+    def timer(self, name):
+        start = _clock()
+        try:
+            yield
+        finally:
+            self.record(name, _clock() - start)
+
+    def report(self):
+        """
+        Return the collected stats as a JSON serializable dict.
+        """
+        with self._lock:
+            timings = {}
+            for name, count in self._counts.items():
+                samples = sorted(self._samples[name])
+                timing = {
+                    'count': count,
+                    'total': self._totals[name],
+                    'mean': self._totals[name] / count,
+                    'max': samples[-1],
+                }
+                for p in PERCENTILES:
+                    index = min(len(samples) - 1, len(samples) * p // 100)
+                    timing['p{0}'.format(p)] = samples[index]
+                timings[name] = timing
+            return {'timings': timings, 'counters': dict(self._counters)}
+
+    def add_hook(self, hook):
+        """
+        Call hook with a report each time `emit` is called.
+        """
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self._hooks.remove(hook)
+
+    def emit(self, report=None):
+        """
+        Call the hooks with the given report, or this object's own.
+        """
+        if self._hooks:
+            if report is None:
+                report = self.report()
+            for hook in list(self._hooks):
+                hook(report)
+
+
+STATS = Stats()
+
+report = STATS.report
+reset = STATS.reset
+add_hook = STATS.add_hook
+remove_hook = STATS.remove_hook
+emit = STATS.emit
+
+_local = threading.local()
+
+def _scopes():
+    return getattr(_local, 'scopes', ())
+
+
+def record(name, seconds):
+    """
+    Record a duration in the process-wide stats, and in those being
+    collected by the current thread.
+    """
+    STATS.record(name, seconds)
+    for scope in _scopes():
+        scope.record(name, seconds)
+
+
+def incr(name, n=1):
+    STATS.incr(name, n)
+    for scope in _scopes():
+        scope.incr(name, n)
+
+
+@contextmanager
+def timer(name):
+    start = _clock()
+    try:
+        yield
+    finally:
+        record(name, _clock() - start)
+
+
+@contextmanager
+def collect():
+    """
+    Collect what the current thread records, while in the block, in a new
+    `Stats` as well as the process-wide one. Work handed to other threads is
+    included if wrapped with `bind`.
+    """
+    scope = Stats()
+    previous = _scopes()
+    _local.scopes = previous + (scope,)
+    try:
+        yield scope
+    finally:
+        _local.scopes = previous
+
+
+def bind(fn):
+    """
+    Wrap fn so that, in whatever thread it is called, it records into the
+    stats the current thread is collecting.
+    """
+    scopes = _scopes()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        previous = _scopes()
+        _local.scopes = scopes
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.scopes = previous
+    return wrapper
+
+
+def timed(name):
+    """
+    Decorator recording the duration of each call under name.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = _clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(name, _clock() - start)
+        return wrapper
+    return decorator
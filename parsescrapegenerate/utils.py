@@ -6,56 +6,175 @@ parsescrapegenerate.utils
 
 Utility functions for ParseScrapeGenerate.
 """
+import gzip
+import io
 import os
 import re
-import requests
+import tempfile
+import threading
 
-from jinja2 import Environment, PackageLoader
-from jinja2.exceptions import TemplateNotFound
-from lxml import html
-from lxml.html.clean import Cleaner
+from collections import OrderedDict
+from copy import deepcopy
+from lxml import etree, html
 try:
     from urllib.parse import urlparse
 except:
     from urlparse import urlparse
 
 from . import __title__
-from .exceptions import FeedPathDoesNotExist
+from .exceptions import ConfigInvalidXPath, FeedPathDoesNotExist
+from .fetcher import get_fetcher
+from .stats import timed
+
+string_types = (type(u''), type(''))
+
+_cleaner = None
+
+def get_cleaner():
+    """
+    Return the shared, preconfigured `Cleaner`.
+    """
+    global _cleaner
+    if _cleaner is None:
+        from lxml.html.clean import Cleaner
+        _cleaner = Cleaner(safe_attrs_only=True, add_nofollow=True)
+    return _cleaner
+
 
 def get_clean_html(node):
-    if node.__class__.__name__ == 'HtmlElement':
-        text = html.tostring(node, pretty_print=True)
-        text = ' '.join(text.decode('utf-8').split())
-    else:
-        text = node
-    cleaner = Cleaner(safe_attrs_only=True, add_nofollow=True)
-    cleaned_html = cleaner.clean_html(text.strip())
-    return re.sub(r'</p>$', '', re.sub(r'^<p>', '', cleaned_html))
+    return get_clean_html_list([node])[0]
 
 
-def get_content(path, xpath_query=''):
+@timed('get_clean_html')
+def get_clean_html_list(nodes):
+    """
+    Clean each of the given nodes, which may be elements or strings. Copies
+    of the elements are cleaned together in a single pass, then each is
+    serialized once.
+    """
+    results = [None] * len(nodes)
+    container = html.Element('div')
+    copies = []
+    for i, node in enumerate(nodes):
+        if isinstance(node, etree._Element):
+            node_copy = deepcopy(node)
+            node_copy.tail = None
+            container.append(node_copy)
+            copies.append((i, node_copy))
+        else:
+            results[i] = _clean_text(node)
+    if copies:
+        get_cleaner()(container)
+        for i, node_copy in copies:
+            if node_copy.getparent() is container:
+                text = html.tostring(node_copy, pretty_print=True,
+                                     encoding='unicode')
+            else:
+                text = _clean_text(html.tostring(nodes[i], with_tail=False,
+                                                 encoding='unicode'))
+            results[i] = _strip_paragraph(' '.join(text.split()))
+    return results
+
+
+def _clean_text(text):
+    text = text.strip()
+    if '<' in text or '>' in text or '&' in text:
+        container = html.fragment_fromstring(text, create_parent='div')
+        get_cleaner()(container)
+        text = html.tostring(container, encoding='unicode')[5:-6]
+    return _strip_paragraph(text)
+
+
+def _strip_paragraph(text):
+    return re.sub(r'</p>$', '', re.sub(r'^<p>', '', text))
+
+
+@timed('get_content')
+def get_content(path, xpath_query='', fetcher=None):
     """
     Fetches the given URL, extracts, cleans, and returns the necessary data.
     """
-    o = urlparse(path)
-    if o.scheme in ['http', 'https']:
-        r = requests.get(path)
-        r.raise_for_status()
-        text = r.text
-    else:
-        if not os.path.exists(path):
-            raise FeedPathDoesNotExist
-        with open(path) as f:
-            text = f.read()
+    text = load_document(path, fetcher)
     if not xpath_query:
         return text
-    tree = html.fromstring(text)
+    return extract_content(html.fromstring(text), xpath_query)
+
+
+def load_document(path, fetcher=None):
+    """
+    Returns the text of the given URL or file path.
+    """
+    o = urlparse(path)
+    if o.scheme in ['http', 'https']:
+        return (fetcher or get_fetcher()).get_text(path)
+    if not os.path.exists(path):
+        raise FeedPathDoesNotExist
+    with open(path) as f:
+        return f.read()
+
+
+def extract_content(tree, xpath_query):
+    """
+    Returns the cleaned first match of xpath_query in the given tree.
+    """
     elems = tree.xpath(xpath_query)
     if not elems:
         return ''
     return get_clean_html(elems[0])
 
 
+_umask = None
+_umask_lock = threading.Lock()
+
+def _get_umask():
+    """
+    Return the process umask, read once. It can only be read by setting it,
+    so it is set to a restrictive value meanwhile, in case other threads
+    create files.
+    """
+    global _umask
+    with _umask_lock:
+        if _umask is None:
+            _umask = os.umask(0o077)
+            os.umask(_umask)
+    return _umask
+
+def write_atomic(path, data, compress=False):
+    """
+    Write the given string, or iterable of strings, to path via a temporary
+    file in the same directory, so that readers never see a partial file.
+    If compress is set, the file is gzipped, and data may also be bytes.
+
+    The file keeps the mode of the file it replaces, or gets the default
+    mode for new files under the process umask.
+    """
+    if isinstance(data, (type(u''), bytes)):
+        data = [data]
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        if compress:
+            with io.open(fd, 'wb') as raw:
+                with gzip.GzipFile('', 'wb', fileobj=raw, mtime=0) as f:
+                    for chunk in data:
+                        if not isinstance(chunk, bytes):
+                            chunk = chunk.encode('utf-8')
+                        f.write(chunk)
+        else:
+            with io.open(fd, 'w', encoding='utf-8') as f:
+                for chunk in data:
+                    f.write(chunk)
+        try:
+            mode = os.stat(path).st_mode & 0o7777
+        except OSError:
+            mode = 0o666 & ~_get_umask()
+        os.chmod(tmp_path, mode)
+        getattr(os, 'replace', os.rename)(tmp_path, path)
+    except:
+        os.remove(tmp_path)
+        raise
+
+
 def lazyattr(fn):
     """
     Lazy loaded attribute.
@@ -72,11 +191,193 @@ def lazyattr(fn):
     return _lazyattr
 
 
-def render_template(node, context={}, loc=(__title__.lower(), 'templates')):
-    env = Environment(loader=PackageLoader(loc[0], loc[1]))
-    env.globals['get_content'] = get_content
-    try:
-        template = env.get_template(node)
-    except TemplateNotFound:
-        template = env.from_string(node)
-    return template.render(context)
+class LRUCache(object):
+    """
+    A small, thread-safe, bounded mapping that discards the least recently
+    used items once the total size of its items exceeds maxsize. Items have a
+    size of 1 unless given one when set.
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                return default
+            self._data[key] = value
+            return value
+
+    def set(self, key, value, size=1):
+        with self._lock:
+            if key in self._data:
+                del self._data[key]
+                self._total -= self._sizes.pop(key)
+            self._data[key] = value
+            self._sizes[key] = size
+            self._total += size
+            while self._total > self.maxsize and len(self._data) > 1:
+                old_key, old_value = self._data.popitem(last=False)
+                self._total -= self._sizes.pop(old_key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._total = 0
+
+
+class XPathPlan(object):
+    """
+    Compiled form of an entry xpath config: the context query plus one
+    compiled query per field.
+    """
+    def __init__(self, context, fields):
+        self.context = context
+        self.fields = fields
+
+    @lazyattr
+    def match(self):
+        """
+        A query that tests whether a single element matches the context
+        query, for use while streaming. Only context queries of the form
+        ``//step[predicate]`` can be streamed.
+
+        Raises `exceptions.ConfigInvalidXPath` for any other context query.
+        """
+        query = self.context.path
+        if not query.startswith('//') or '/' in _strip_predicates(query[2:]):
+            raise ConfigInvalidXPath(
+                "Context {0!r} cannot be streamed, it must be of the form "
+                "//step[predicate]".format(query))
+        return etree.XPath('self::' + query[2:])
+
+
+def _strip_predicates(query):
+    """
+    Return query with its bracketed predicates and quoted strings removed.
+    """
+    stripped = []
+    depth = 0
+    quote = None
+    for char in query:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char == '[':
+            depth += 1
+        elif char == ']':
+            depth -= 1
+        elif depth == 0:
+            stripped.append(char)
+    return ''.join(stripped)
+
+
+XPATH_PLAN_CACHE_SIZE = 256
+
+_xpath_plan_cache = LRUCache(XPATH_PLAN_CACHE_SIZE)
+
+def get_xpath_plan(xpath_config):
+    """
+    Compile the given xpath config dict into an `XPathPlan`. Plans are cached
+    by their queries, so configs sharing the same rules share a plan.
+
+    Raises `exceptions.ConfigInvalidXPath` if any query does not compile.
+    """
+    key = tuple(sorted(xpath_config.items()))
+    plan = _xpath_plan_cache.get(key)
+    if plan is None:
+        compiled = {}
+        for name, query in key:
+            try:
+                compiled[name] = etree.XPath(query)
+            except (etree.XPathSyntaxError, TypeError, ValueError):
+                raise ConfigInvalidXPath(
+                    "Invalid XPath for {0}: {1!r}".format(name, query))
+        context = compiled.pop('context')
+        plan = XPathPlan(context, sorted(compiled.items()))
+        _xpath_plan_cache.set(key, plan)
+    return plan
+
+
+TEMPLATE_LOC = (__title__.lower(), 'templates')
+TEMPLATE_CACHE_SIZE = 512
+
+_environments = {}
+_environments_lock = threading.Lock()
+_template_cache = LRUCache(TEMPLATE_CACHE_SIZE)
+
+def get_environment(loc=TEMPLATE_LOC):
+    """
+    Return the shared Jinja2 environment for the given template location,
+    creating it on first use.
+    """
+    loc = tuple(loc)
+    env = _environments.get(loc)
+    if env is None:
+        with _environments_lock:
+            env = _environments.get(loc)
+            if env is None:
+                from jinja2 import Environment, PackageLoader
+                env = Environment(loader=PackageLoader(loc[0], loc[1]))
+                env.globals['get_content'] = get_content
+                _environments[loc] = env
+    return env
+
+
+def get_template(node, loc=TEMPLATE_LOC):
+    """
+    Return a compiled template for node, which may be either the name of a
+    template file found at loc or a template source string. Compiled
+    templates are cached by (loc, node).
+    """
+    if not isinstance(node, string_types):
+        return node
+    key = (tuple(loc), node)
+    template = _template_cache.get(key)
+    if template is None:
+        from jinja2.exceptions import TemplateNotFound
+        env = get_environment(loc)
+        try:
+            template = env.get_template(node)
+        except TemplateNotFound:
+            template = env.from_string(node)
+        _template_cache.set(key, template)
+    return template
+
+
+def compile_templates(templates, loc=TEMPLATE_LOC):
+    """
+    Compile each value of the given templates dict, returning a new dict
+    with the same keys.
+    """
+    return dict((key, get_template(value, loc))
+                for key, value in templates.items())
+
+
+@timed('render_template')
+def render_template(node, context={}, loc=TEMPLATE_LOC):
+    return get_template(node, loc).render(context)
+
+
+def stream_template(node, context={}, loc=TEMPLATE_LOC):
+    """
+    Render the given template incrementally, returning an iterator of
+    strings.
+    """
+    return get_template(node, loc).generate(context)
@@ -46,6 +46,9 @@ setup(
     zip_safe=False,
     install_requires=get_requirements('requirements/base.txt')
                     +get_requirements('requirements/base-py{0}{1}.txt'.format(vmajor,vminor)),
+    extras_require={
+        'async': ['aiohttp'],
+    },
     test_suite='tests',
     tests_require=get_requirements('requirements/test.txt')
                  +get_requirements('requirements/test-py{0}{1}.txt'.format(vmajor,vminor)),
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_aio
+--------
+
+Tests for `parsescrapegenerate.aio` module.
+"""
+import shutil
+import sys
+import tempfile
+import threading
+
+if sys.version_info[:2] < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+try:
+    import asyncio
+    from parsescrapegenerate import aio
+except (ImportError, SyntaxError):
+    aio = None
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from parsescrapegenerate import main, stats
+from parsescrapegenerate.cache import HttpCache
+from parsescrapegenerate.config import get_config
+from parsescrapegenerate.exceptions import PageTooLarge
+
+LISTING = (u'<html><head><title>Caf\xe9</title></head><body>' + u''.join(
+    u'<div class="entry"><a href="/article/{0}">Entry {0}</a></div>'.format(i)
+    for i in range(5)) + u'</body></html>')
+ARTICLE = u'<html><body><div class="article"><p>Article {0}</p></div></body></html>'
+
+class SiteHandler(BaseHTTPRequestHandler):
+    """
+    Serves a listing of articles. The first request to /flaky fails with a
+    503.
+    """
+    flaky = []
+
+    def do_GET(self):
+        if self.path == '/flaky' and not self.flaky:
+            self.flaky.append(self.path)
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path.startswith('/article/'):
+            body = ARTICLE.format(self.path.split('/')[-1]).encode('utf-8')
+            content_type = 'text/html; charset=utf-8'
+        else:
+            body = LISTING.encode('latin-1')
+            content_type = 'text/html; charset=ISO-8859-1'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@unittest.skipIf(aio is None, 'asyncio is not available')
+class TestAio(unittest.TestCase):
+    def test_scrape_file(self):
+        """
+        Test that a local page scrapes the same as with `main.scrape`.
+        """
+        feed_config = get_config('tests/test-config/valid-config.yml')
+        feed = run(aio.scrape(feed_config))
+        expected = main.scrape(feed_config)
+        self.assertEqual([(e.id, e.title, e.content) for e in feed.entries],
+                         [(e.id, e.title, e.content) for e in expected.entries])
+        self.assertIn('<rss', run(aio.generate(feed)))
+
+
+@unittest.skipIf(aio is None or aiohttp is None, 'aiohttp is not installed')
+class TestAioHttp(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingServer(('127.0.0.1', 0), SiteHandler)
+        cls.base = 'http://127.0.0.1:{0}'.format(cls.server.server_port)
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_fetcher(self):
+        """
+        Test that 5xx responses are retried, charsets are honored and the
+        page size limit is enforced.
+        """
+        async def fetch():
+            fetcher = aio.AsyncFetcher(backoff=0, max_page_size=len(LISTING))
+            try:
+                text = await fetcher.get_text(self.base + '/flaky')
+                tree = await fetcher.get_tree(self.base + '/list')
+                with self.assertRaises(PageTooLarge):
+                    fetcher.max_page_size = 10
+                    await fetcher.get_text(self.base + '/list')
+            finally:
+                await fetcher.close()
+            return text, tree
+
+        text, tree = run(fetch())
+        self.assertIn(u'Caf\xe9', text)
+        self.assertEqual(tree.findtext('.//title'), u'Caf\xe9')
+
+    def test_fetcher_cache(self):
+        """
+        Test that fresh cached responses are used without a request, and
+        that the cache is read and written off the loop.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        threads = set()
+
+        async def fetch():
+            fetcher = aio.AsyncFetcher(cache=HttpCache(directory, ttl=60))
+            get = fetcher.cache.get
+            fetcher.cache.get = lambda url: threads.add(
+                threading.current_thread()) or get(url)
+            try:
+                first = await fetcher.get_text(self.base + '/article/1')
+                before = stats.report()['counters'].get('http.requests', 0)
+                second = await fetcher.get_text(self.base + '/article/1')
+                after = stats.report()['counters'].get('http.requests', 0)
+            finally:
+                await fetcher.close()
+            return first, second, after - before
+
+        first, second, requests = run(fetch())
+        self.assertIn('Article 1', first)
+        self.assertEqual(first, second)
+        self.assertEqual(requests, 0)
+        self.assertTrue(threads)
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def test_scrape(self):
+        """
+        Test that many feeds, with get_content calls, can be scraped
+        concurrently from one loop, and that the executor thread of each
+        waits for the get_content documents once, rather than per call.
+        """
+        feed_config = {
+            'path': self.base + '/list',
+            'entry': {
+                'templates': {
+                    'link': self.base + '{{ entry.link }}',
+                    'content': "{{ get_content('" + self.base + "' ~ "
+                               "entry.link, '//div[@class=\"article\"]') }}",
+                },
+                'xpath': {
+                    'context': "//div[@class='entry']",
+                    'title': 'a/text()',
+                    'link': 'a/@href',
+                },
+            },
+        }
+
+        async def scrape_all():
+            fetcher = aio.AsyncFetcher()
+            try:
+                return await asyncio.gather(*[
+                    aio.scrape(feed_config, fetcher=fetcher)
+                    for _ in range(20)])
+            finally:
+                await fetcher.close()
+
+        with mock.patch.object(
+                asyncio, 'run_coroutine_threadsafe',
+                wraps=asyncio.run_coroutine_threadsafe) as waits:
+            feeds = run(scrape_all())
+        self.assertEqual(waits.call_count, 20)
+        self.assertEqual(len(feeds), 20)
+        for feed in feeds:
+            self.assertEqual(feed.title, u'Caf\xe9')
+            self.assertEqual([entry.title for entry in feed.entries],
+                             ['Entry {0}'.format(i) for i in range(5)])
+            self.assertIn('Article 3', feed.entries[3].content)
+
+
+if __name__ == '__main__':
+    unittest.main()
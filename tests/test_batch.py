@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_batch
+----------
+
+Tests for `parsescrapegenerate.batch` module.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+if sys.version_info[:2] < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from parsescrapegenerate import batch
+
+CONFIG = """
+path: "tests/test-main/sample.html"
+output: "{output}"
+entry:
+  xpath:
+    context: "//div[@class='entry']"
+    title: "h2[@class='title']/a/text()"
+"""
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write_config('a.yml', os.path.join(self.directory, 'a.xml'))
+        self.write_config('b.yml', os.path.join(self.directory, 'x', 'b.xml'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_config(self, name, output):
+        with open(os.path.join(self.directory, name), 'w') as f:
+            f.write(CONFIG.format(output=output))
+
+    def test_find_configs(self):
+        self.assertEqual(batch.find_configs([self.directory]), [
+            os.path.join(self.directory, 'a.yml'),
+            os.path.join(self.directory, 'b.yml'),
+        ])
+
+    def test_run_batch(self):
+        """
+        Test that a failing feed does not stop the others.
+        """
+        results = batch.run_batch([self.directory], workers=2)
+        self.assertEqual([r.ok for r in results], [True, False])
+        self.assertEqual(results[0].entries, 3)
+        self.assertTrue(os.path.exists(results[0].output))
+        self.assertIn('2 feeds, 1 failed', batch.format_summary(results))
+
+
+if __name__ == '__main__':
+    unittest.main()
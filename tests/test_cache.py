@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_cache
+----------
+
+Tests for `parsescrapegenerate.cache` module.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+if sys.version_info[:2] < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from parsescrapegenerate import cache
+
+class TestHttpCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = cache.HttpCache(self.directory, max_size=10)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_set_get(self):
+        self.cache.set('http://example.com/', b'foo',
+                       {'ETag': '"x"', 'Last-Modified': 'yesterday'}, 'utf-8')
+        cached = self.cache.get('http://example.com/')
+        self.assertEqual(cached.text, 'foo')
+        self.assertEqual(cached.conditional_headers(), {
+            'If-None-Match': '"x"', 'If-Modified-Since': 'yesterday'
+        })
+
+    def test_get_missing(self):
+        self.assertIsNone(self.cache.get('http://example.com/missing'))
+
+    def test_evict(self):
+        """
+        Test that the least recently used responses are evicted once the
+        cache is over max_size.
+        """
+        self.cache.set('http://example.com/a', b'aaaa', {})
+        self.cache.set('http://example.com/b', b'bbbb', {})
+        past = time.time() - 60
+        os.utime(self.cache._path('http://example.com/b', '.json'),
+                 (past, past))
+        self.cache.set('http://example.com/c', b'cccc', {})
+        self.assertIsNotNone(self.cache.get('http://example.com/a'))
+        self.assertIsNone(self.cache.get('http://example.com/b'))
+        self.assertIsNotNone(self.cache.get('http://example.com/c'))
+
+    def test_evict_to_low_watermark(self):
+        """
+        Test that eviction frees space below max_size, so that the next
+        inserts do not scan the cache directory.
+        """
+        big = cache.HttpCache(self.directory, max_size=100)
+        for i in range(11):
+            big.set('http://example.com/{0}'.format(i), b'x' * 10, {})
+        self.assertLessEqual(big._size, 100 * cache.LOW_WATERMARK)
+        with mock.patch.object(big, '_sizes') as sizes:
+            big.set('http://example.com/new', b'x' * 10, {})
+        self.assertFalse(sizes.called)
+
+    def test_is_fresh(self):
+        cached = cache.CachedResponse('http://example.com/', b'',
+                                      fetched=time.time())
+        self.assertTrue(cached.is_fresh(60))
+        self.assertFalse(cached.is_fresh(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_cli
+--------
+
+Tests for `parsescrapegenerate.cli` module.
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+if sys.version_info[:2] < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+HEAVY_MODULES = ('requests', 'feedparser', 'jinja2', 'lxml.html.clean',
+                 'sqlite3', 'concurrent.futures')
+
+def run_cli(*args, **kwargs):
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'parsescrapegenerate.cli'] + list(args),
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate(kwargs.get('stdin', b''))
+    return process.returncode, stdout.decode('utf-8'), stderr.decode('utf-8')
+
+
+class TestCli(unittest.TestCase):
+    def test_main(self):
+        """
+        Test that the generated feed is written to STDOUT.
+        """
+        returncode, stdout, stderr = run_cli(
+            'tests/test-config/valid-config.yml')
+        self.assertEqual(returncode, 0, stderr)
+        self.assertTrue(stdout.startswith('<?xml'))
+        self.assertTrue(stdout.rstrip().endswith('</rss>'))
+
+    def test_stats(self):
+        """
+        Test that stats are written to STDERR as JSON.
+        """
+        returncode, stdout, stderr = run_cli(
+            '--stats', 'tests/test-config/valid-config.yml')
+        self.assertEqual(returncode, 0, stderr)
+        stats = json.loads(stderr)
+        self.assertEqual(stats['timings']['fetch_entries']['count'], 1)
+        self.assertIn('generate', stats['timings'])
+
+    def test_output(self):
+        """
+        Test that --output writes the feed and a gzipped copy, then leaves
+        them untouched when nothing changed.
+        """
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'feed.xml')
+        args = ('--output=' + path, '--gzip',
+                'tests/test-config/valid-config.yml')
+        returncode, stdout, stderr = run_cli(*args)
+        self.assertEqual(returncode, 0, stderr)
+        self.assertEqual(stdout, '')
+        with open(path) as f:
+            self.assertTrue(f.read().rstrip().endswith('</rss>'))
+        self.assertTrue(os.path.exists(path + '.gz'))
+
+        mtime = os.stat(path).st_mtime
+        returncode, stdout, stderr = run_cli(*args)
+        self.assertEqual(returncode, 3, stderr)
+        self.assertEqual(os.stat(path).st_mtime, mtime)
+
+    def test_import_is_light(self):
+        """
+        Test that importing the CLI loads none of the heavy dependencies,
+        and takes a fraction of the time that importing `main` and those
+        dependencies afterwards, in the same process, does.
+        """
+        script = (
+            'import importlib, json, sys, time\n'
+            'clock = getattr(time, "perf_counter", time.time)\n'
+            'start = clock()\n'
+            'import parsescrapegenerate.cli\n'
+            'elapsed = clock() - start\n'
+            'loaded = [m for m in {0!r} if m in sys.modules]\n'
+            'start = clock()\n'
+            'for m in ("parsescrapegenerate.main",) + {0!r}:\n'
+            '    importlib.import_module(m)\n'
+            'reference = clock() - start\n'
+            'print(json.dumps([elapsed, reference, loaded]))\n').format(
+                HEAVY_MODULES)
+        output = subprocess.check_output([sys.executable, '-c', script])
+        elapsed, reference, loaded = json.loads(output.decode('utf-8'))
+        self.assertEqual(loaded, [])
+        self.assertLess(elapsed, reference / 4)
+
+    def test_scrape_without_stdin_skips_parse(self):
+        """
+        Test that a scrape of a local page with no existing feed and no
+        state dir does not load requests, feedparser or sqlite3.
+        """
+        script = (
+            'import sys\n'
+            'from parsescrapegenerate import config, main\n'
+            'feed_config = config.get_config({0!r})\n'
+            'main.generate(main.scrape(feed_config))\n'
+            'print(",".join(m for m in ("requests", "feedparser", "sqlite3") '
+            'if m in sys.modules))\n').format(
+                'tests/test-config/valid-config.yml')
+        output = subprocess.check_output([sys.executable, '-c', script])
+        self.assertEqual(output.decode('utf-8').strip(), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,7 +15,8 @@ else:
 
 from parsescrapegenerate import config
 from parsescrapegenerate.exceptions import (
-    ConfigDoesNotExist, ConfigIsNotValid, ConfigMissingRequiredKey
+    ConfigDoesNotExist, ConfigInvalidXPath, ConfigIsNotValid,
+    ConfigMissingRequiredKey
 )
 
 class TestConfig(unittest.TestCase):
@@ -68,6 +69,44 @@ class TestConfig(unittest.TestCase):
         self.assertRaises(ConfigMissingRequiredKey, config.get_config,
                           'tests/test-config/missing-key-config.yml')
 
+    def test_invalid_xpath(self):
+        """
+        Test that `exceptions.ConfigInvalidXPath` is raised when the given
+        config file contains an XPath query that does not compile.
+        """
+        self.assertRaises(ConfigInvalidXPath, config.get_config,
+                          'tests/test-config/invalid-xpath-config.yml')
+
+    def test_invalid_settings(self):
+        """
+        Test that `exceptions.ConfigIsNotValid` is raised for an unknown
+        id_scheme or a non-positive limit.
+        """
+        conf = config.get_config('tests/test-config/valid-config.yml')
+        invalid = [('id_scheme', 'date'), ('max_entries', 0),
+                   ('max_age_days', 'forever'), ('interval', True)]
+        for key, value in invalid:
+            invalid_conf = dict(conf, entry=dict(conf['entry']))
+            if key == 'id_scheme':
+                invalid_conf['entry'][key] = value
+            else:
+                invalid_conf[key] = value
+            self.assertRaises(ConfigIsNotValid, config._validate_config,
+                              invalid_conf)
+
+    def test_stream_exclusive(self):
+        """
+        Test that streaming cannot be combined with pagination or workers,
+        which it would ignore.
+        """
+        conf = config.get_config('tests/test-config/valid-config.yml')
+        stream_entry = dict(conf['entry'], stream=True)
+        config._validate_config(dict(conf, entry=stream_entry))
+        self.assertRaises(ConfigIsNotValid, config._validate_config, dict(
+            conf, entry=stream_entry, pagination={'next': '//a/@href'}))
+        self.assertRaises(ConfigIsNotValid, config._validate_config, dict(
+            conf, entry=dict(stream_entry, workers=2)))
+
 
 if __name__ == '__main__':
     unittest.main()
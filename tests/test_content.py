@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_content
+------------
+
+Tests for `parsescrapegenerate.content` module.
+"""
+import sys
+
+if sys.version_info[:2] < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from parsescrapegenerate import content, utils
+
+SAMPLE = 'tests/test-main/sample.html'
+
+class TestContentLoader(unittest.TestCase):
+    def setUp(self):
+        self.loader = content.ContentLoader(workers=2, per_host=1)
+
+    def test_call(self):
+        """
+        Test that the loader returns the same data as `utils.get_content`.
+        """
+        self.assertEqual(self.loader(SAMPLE, '//title/text()'),
+                         utils.get_content(SAMPLE, '//title/text()'))
+
+    def test_document_memo(self):
+        """
+        Test that repeated calls for the same path reuse the parsed document.
+        """
+        self.loader(SAMPLE, '//title/text()')
+        text, tree = self.loader._documents.get(SAMPLE)
+        self.assertEqual(self.loader(SAMPLE, '//html/@lang'),
+                         utils.get_content(SAMPLE, '//html/@lang'))
+        self.assertIs(self.loader._documents.get(SAMPLE)[1], tree)
+
+    def test_document_memo_cap(self):
+        """
+        Test that documents are evicted once over max_document_bytes.
+        """
+        loader = content.ContentLoader(max_document_bytes=1)
+        loader(SAMPLE, '//title/text()')
+        loader('tests/test-utils/template.txt')
+        self.assertNotIn(SAMPLE, loader._documents)
+
+    def test_find_calls(self):
+        """
+        Test that `get_content` calls made by templates are found.
+        """
+        templates = utils.compile_templates({
+            'content': "{{ get_content(entry.link, '//title/text()') }}"
+        })
+        rows = [{'link': SAMPLE}, {'link': 'tests/test-main/other.html'}]
+        self.assertEqual(self.loader.find_calls(templates, rows), [
+            (SAMPLE, '//title/text()'),
+            ('tests/test-main/other.html', '//title/text()'),
+        ])
+
+    def test_prefetch(self):
+        """
+        Test that prefetched calls are resolved and failed calls are not.
+        """
+        calls = [(SAMPLE, '//title/text()'), ('does-not-exist.html', '')]
+        self.loader.prefetch(calls)
+        self.assertIn(calls[0], self.loader._results)
+        self.assertNotIn(calls[1], self.loader._results)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_daemon
+-----------
+
+Tests for `parsescrapegenerate.daemon` module.
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+if sys.version_info[:2] < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from parsescrapegenerate import daemon
+
+CONFIG = """
+path: "tests/test-main/sample.html"
+interval: {interval}
+entry:
+  xpath:
+    context: "//div[@class='entry']"
+    title: "h2[@class='title']/a/text()"
+"""
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.configs = os.path.join(self.directory, 'configs')
+        self.output = os.path.join(self.directory, 'output')
+        os.makedirs(self.configs)
+        os.makedirs(self.output)
+        self.write_config('a.yml', 60)
+        self.daemon = daemon.Daemon(self.configs, jitter=0,
+                                    output_dir=self.output)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_config(self, name, interval, mtime=None):
+        path = os.path.join(self.configs, name)
+        with open(path, 'w') as f:
+            f.write(CONFIG.format(interval=interval))
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def test_schedule(self):
+        """
+        Test that feeds are run straight away, then once per interval.
+        """
+        results = self.daemon.tick(now=1000)
+        self.assertEqual([r.ok for r in results], [True])
+        self.assertEqual(results[0].entries, 3)
+        self.assertTrue(os.path.exists(os.path.join(self.output, 'a.xml')))
+
+        next_run = self.daemon.next_run()
+        self.assertAlmostEqual(next_run - results[0].elapsed, 1060, delta=5)
+        self.assertEqual(self.daemon.tick(now=next_run - 1), [])
+        self.assertEqual(len(self.daemon.tick(now=next_run)), 1)
+
+    def test_reload(self):
+        """
+        Test that changed configs are run again with their new settings,
+        and removed ones are dropped.
+        """
+        path = self.write_config('a.yml', 60, mtime=1000)
+        self.daemon.tick(now=1000)
+        self.write_config('a.yml', 120, mtime=2000)
+        self.write_config('b.yml', 60)
+
+        results = self.daemon.tick(now=1000 + daemon.RELOAD_INTERVAL)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(self.daemon.feeds[path].config['interval'], 120)
+
+        os.remove(path)
+        self.daemon.reload()
+        self.assertEqual(list(self.daemon.status()),
+                         [os.path.join(self.configs, 'b.yml')])
+
+    def test_slow_feed(self):
+        """
+        Test that a feed that hangs does not hold up the others.
+        """
+        slow = self.write_config('a.yml', 60)
+        fast = self.write_config('b.yml', 0.05)
+        release = threading.Event()
+        run_feed = daemon.run_feed
+
+        def run(path, *args):
+            if path == slow:
+                release.wait(10)
+            return run_feed(path, *args)
+
+        results = []
+        feed_daemon = daemon.Daemon(self.configs, jitter=0,
+                                    output_dir=self.output,
+                                    reload_interval=0.05)
+        with mock.patch.object(daemon, 'run_feed', side_effect=run):
+            thread = threading.Thread(target=feed_daemon.run_forever,
+                                      args=(results.extend,))
+            thread.start()
+            try:
+                deadline = time.time() + 10
+                while (len([r for r in results if r.config_path == fast]) < 3 and
+                       time.time() < deadline):
+                    time.sleep(0.01)
+                self.assertTrue(feed_daemon.status()[slow]['running'])
+            finally:
+                release.set()
+                feed_daemon.stop()
+                thread.join()
+        self.assertGreaterEqual(len([r for r in results if r.config_path == fast]), 3)
+        self.assertIn(slow, [r.config_path for r in results])
+
+    def test_invalid_config(self):
+        """
+        Test that an invalid config is reported and not run.
+        """
+        path = self.write_config('a.yml', -1)
+        self.assertEqual(self.daemon.tick(now=1000), [])
+        status = self.daemon.status()[path]
+        self.assertFalse(status['ok'])
+        self.assertIsNone(status['next_run'])
+        self.assertIn('interval', status['error'])
+
+    def test_server(self):
+        """
+        Test that written feeds and the status are served.
+        """
+        self.daemon.tick()
+        server = daemon.FeedServer(self.daemon, port=0).start()
+        try:
+            base = 'http://127.0.0.1:{0}/'.format(server.server_port)
+            body = urlopen(base + 'a.xml').read()
+            with open(os.path.join(self.output, 'a.xml'), 'rb') as f:
+                self.assertEqual(body, f.read())
+            status = json.loads(urlopen(base + 'status').read().decode('utf-8'))
+            self.assertEqual(status[os.path.join(self.configs, 'a.yml')]['entries'], 3)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_fastparse
+--------------
+
+Tests for `parsescrapegenerate.fastparse` module.
+"""
+import io
+import sys
+import time
+
+if sys.version_info[:2] < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from lxml.etree import XMLSyntaxError
+from parsescrapegenerate import fastparse, main
+from parsescrapegenerate.exceptions import InvalidFeedFormat
+
+TIMESTAMP=1404184359
+
+def read(name):
+    with io.open('tests/test-fastparse/' + name, encoding='utf-8') as f:
+        return f.read()
+
+
+class TestFastParse(unittest.TestCase):
+    def test_parse_rss(self):
+        """
+        Test that the RSS metadata and entry fields match feedparser's.
+        """
+        source = read('rss.xml')
+        fast = fastparse.parse(source)
+        full = main.parse(source)
+        self.assertEqual(fast['feed']['title'], full['feed']['title'])
+        self.assertEqual(fast['feed']['language'], full['feed']['language'])
+        self.assertEqual(fast['feed']['updated_parsed'],
+                         full['feed']['updated_parsed'])
+        for key in ('id', 'title', 'link', 'summary', 'published_parsed'):
+            self.assertEqual([e[key] for e in fast['entries']],
+                             [e[key] for e in full['entries']])
+
+    def test_parse_atom(self):
+        fast = fastparse.parse(read('atom.xml').encode('utf-8'))
+        self.assertEqual(fast['feed']['language'], 'en-US')
+        self.assertEqual(fast['feed']['updated_parsed'],
+                         time.gmtime(TIMESTAMP))
+        self.assertEqual(fast['entries'], [{
+            'id': 'tag:example.com,2014-07-01:/entry1.html',
+            'title': 'Entry1 Title',
+            'link': 'http://example.com/entry1.html',
+            'content': [{'value': '<p>Entry1 Content</p>'}],
+            'published': '2014-07-01T03:12:39Z',
+            'published_parsed': time.gmtime(TIMESTAMP),
+        }])
+
+    def test_parse_atom_source(self):
+        """
+        Test that the id and other fields of an entry's <source> do not
+        replace the entry's own.
+        """
+        source = (
+            '<feed xmlns="http://www.w3.org/2005/Atom"><title>Planet</title>'
+            '<entry><id>tag:example.com,2014:entry1</id>'
+            '<source><id>tag:example.org,2014:feed</id>'
+            '<title>Source Title</title>'
+            '<link href="http://example.org/"/></source>'
+            '<title>Entry1 Title</title>'
+            '<link href="http://example.com/entry1.html"/></entry></feed>')
+        entry = fastparse.parse(source)['entries'][0]
+        self.assertEqual(entry['id'], 'tag:example.com,2014:entry1')
+        self.assertEqual(entry['title'], 'Entry1 Title')
+        self.assertEqual(entry['link'], 'http://example.com/entry1.html')
+        full = main.parse(source)['entries'][0]
+        self.assertEqual((entry['id'], entry['title'], entry['link']),
+                         (full['id'], full['title'], full['link']))
+
+    def test_parse_invalid(self):
+        self.assertRaises(InvalidFeedFormat, fastparse.parse, '<html></html>')
+        self.assertRaises(XMLSyntaxError, fastparse.parse, '<rss><channel>')
+
+    def test_main_parse_fallback(self):
+        """
+        Test that malformed feeds fall back to feedparser.
+        """
+        parsed = main.parse('<rss><channel><title>x</title>', fast=True)
+        self.assertEqual(parsed['feed']['title'], 'x')
+
+    def test_parse_date(self):
+        self.assertEqual(fastparse.parse_date('2014-07-01T05:12:39+02:00'),
+                         time.gmtime(TIMESTAMP))
+        self.assertEqual(fastparse.parse_date('Tue, 01 Jul 2014 03:12:39 Z'),
+                         time.gmtime(TIMESTAMP))
+        self.assertIsNone(fastparse.parse_date('yesterday'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,9 +13,15 @@ if sys.version_info[:2] < (2, 7):
     import unittest2 as unittest
 else:
     import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
 
-from parsescrapegenerate import config, feed
-from parsescrapegenerate.exceptions import InvalidFeedFormat
+from parsescrapegenerate import config, content, feed, main, state, utils
+from parsescrapegenerate.exceptions import (
+    ConfigInvalidXPath, InvalidFeedFormat
+)
 
 TIMESTAMP=1404184359
 
@@ -67,6 +73,180 @@ class TestFeed(unittest.TestCase):
         self.assertEqual(entries[1].link, "http://example.com/entry2.html")
         self.assertEqual(entries[2].content, "Entry3 Content")
 
+    def test_fetch_entries_existing(self):
+        """
+        Test that known entries are skipped without rendering their content.
+        """
+        existing_ids = [e.id for e in self.feed.fetch_entries(self.conf['entry'])]
+        entry_conf = dict(self.conf['entry'], templates={
+            'link': self.conf['entry']['templates']['link'],
+            'content': "{{ get_content('tests/test-main/missing.html') }}"
+        })
+        self.assertEqual(self.feed.fetch_entries(entry_conf, existing_ids), [])
+        entries = self.feed.fetch_entries(self.conf['entry'], existing_ids[:2])
+        self.assertEqual([e.title for e in entries], ["Entry3 Title"])
+
+    def test_fetch_entries_stop_after_known(self):
+        entry_conf = dict(self.conf['entry'], stop_after_known=1)
+        existing_ids = [self.feed.fetch_entries(entry_conf)[1].id]
+        entries = self.feed.fetch_entries(entry_conf, existing_ids)
+        self.assertEqual([e.title for e in entries], ["Entry1 Title"])
+
+    def test_fetch_entries_paginated(self):
+        """
+        Test that following pages are scraped, each at most once.
+        """
+        paged = feed.get_feed()
+        paged.link = 'tests/test-feed/page1.html'
+        paged.pagination = {'next': "//a[@rel='next']/@href"}
+        entries = paged.fetch_entries(self.conf['entry'])
+        self.assertEqual([e.title for e in entries], [
+            "Page1 Entry1 Title", "Page1 Entry2 Title",
+            "Page2 Entry1 Title", "Page2 Entry2 Title",
+        ])
+
+    def test_fetch_entries_paginated_limits(self):
+        paged = feed.get_feed()
+        paged.link = 'tests/test-feed/page1.html'
+        paged.pagination = {'next': "//a[@rel='next']", 'max_entries': 3}
+        self.assertEqual(len(paged.fetch_entries(self.conf['entry'])), 3)
+        paged.pagination = {'next': "//a[@rel='next']", 'max_pages': 1}
+        self.assertEqual(len(paged.fetch_entries(self.conf['entry'])), 2)
+
+    def test_fetch_entries_paginated_prefetch(self):
+        """
+        Test that only the content of entries within max_entries is
+        prefetched.
+        """
+        entry_conf = dict(self.conf['entry'], prefetch=True, templates={
+            'content': "{{ get_content('http://example.com' ~ entry.link) }}"
+        })
+        self.feed.pagination = {'max_entries': 1}
+        with mock.patch.object(content, 'load_document',
+                               return_value='<p>Content</p>') as load:
+            entries = self.feed.fetch_entries(entry_conf)
+        self.assertEqual(len(entries), 1)
+        self.assertEqual([c[0][0] for c in load.call_args_list],
+                         ['http://example.com/entry1.html'])
+
+    def test_fetch_entries_paginated_known(self):
+        """
+        Test that pagination stops at a page with only known entries.
+        """
+        paged = feed.get_feed()
+        paged.link = 'tests/test-feed/page1.html'
+        existing_ids = [e.id for e in paged.fetch_entries(self.conf['entry'])]
+        paged.pagination = {'next': "//a[@rel='next']/@href"}
+        self.assertEqual(paged.fetch_entries(self.conf['entry'], existing_ids),
+                         [])
+
+    def test_fetch_entries_stream(self):
+        """
+        Test that streaming extraction finds the same entries.
+        """
+        entry_conf = dict(self.conf['entry'], stream=True)
+        streamed = feed.get_feed()
+        streamed.link = self.conf['path']
+        expected = self.feed.fetch_entries(self.conf['entry'])
+        entries = streamed.fetch_entries(entry_conf)
+        self.assertEqual([(e.title, e.link, e.content) for e in entries],
+                         [(e.title, e.link, e.content) for e in expected])
+
+    def test_fetch_entries_stream_skips_tree(self):
+        """
+        Test that streaming finds the page title and lang without loading
+        the page into a tree.
+        """
+        conf = dict(self.conf)
+        del conf['title']
+        conf['entry'] = dict(conf['entry'], stream=True)
+        new_feed = main.scrape(conf)
+        self.assertEqual(new_feed.title, "Sample HTML Page")
+        self.assertEqual(new_feed.lang, "en-US")
+        self.assertEqual(len(new_feed.entries), 3)
+        self.assertFalse(hasattr(new_feed, '_lazy_tree'))
+
+    def test_fetch_entries_parallel(self):
+        """
+        Test that extraction on a process pool finds the same entries, in
+        the same order.
+        """
+        entry_conf = dict(self.conf['entry'], workers=2, parallel_threshold=2)
+        parallel = feed.get_feed()
+        parallel.link = self.conf['path']
+        expected = self.feed.fetch_entries(self.conf['entry'])
+        entries = parallel.fetch_entries(entry_conf)
+        self.assertEqual([(e.title, e.link, e.content) for e in entries],
+                         [(e.title, e.link, e.content) for e in expected])
+
+    def test_get_process_pool(self):
+        """
+        Test that pools are shared, do not fork their workers, and can be
+        shut down.
+        """
+        pool = feed.get_process_pool(2)
+        self.assertIs(feed.get_process_pool(2), pool)
+        if hasattr(pool, '_mp_context'):
+            self.assertNotEqual(pool._mp_context.get_start_method(), 'fork')
+        feed.shutdown_process_pools()
+        self.assertIsNot(feed.get_process_pool(2), pool)
+        feed.shutdown_process_pools()
+
+    def test_fetch_entries_parallel_threshold(self):
+        """
+        Test that pages below the threshold are extracted serially.
+        """
+        entry_conf = dict(self.conf['entry'], workers=2)
+        nodes = self.feed.tree.xpath(entry_conf['xpath']['context'])
+        self.feed.extract_rows_parallel = None
+        rows = self.feed.extract_page_rows(
+            nodes, utils.get_xpath_plan(entry_conf['xpath']), entry_conf)
+        self.assertEqual(len(rows), len(nodes))
+
+    def test_fetch_entries_id_schemes(self):
+        """
+        Test that ids can come from an XPath rule, or hash the link or the
+        extracted vals.
+        """
+        entry_conf = dict(self.conf['entry'], id_scheme='url')
+        links = [e.link for e in self.feed.fetch_entries(entry_conf)]
+        ids = [e.id for e in self.feed.fetch_entries(entry_conf)]
+        self.assertEqual(ids, [feed._hash_id(link) for link in links])
+
+        entry_conf['id_scheme'] = 'content'
+        content_ids = [e.id for e in self.feed.fetch_entries(entry_conf)]
+        self.assertEqual(len(set(content_ids)), 3)
+        self.assertNotEqual(content_ids, ids)
+
+        entry_conf['xpath'] = dict(entry_conf['xpath'],
+                                   id="h2[@class='title']/a/@href")
+        self.assertEqual([e.id for e in self.feed.fetch_entries(entry_conf)],
+                         ['/entry1.html', '/entry2.html', '/entry3.html'])
+
+    def test_fetch_entries_history(self):
+        """
+        Test that entries already in the history keep their id and date, so
+        are known on any day.
+        """
+        history = state.EntryHistory([{
+            'id': 'tag:example.com,2014-07-01:/entry1.html',
+            'link': 'http://example.com/entry1.html',
+            'published_parsed': time.gmtime(TIMESTAMP),
+        }])
+        entries = self.feed.fetch_entries(self.conf['entry'], [], history)
+        self.assertEqual(entries[0].id,
+                         'tag:example.com,2014-07-01:/entry1.html')
+        self.assertEqual(entries[0].published, 'Tue, 01 Jul 2014 03:12:39 Z')
+        entries = self.feed.fetch_entries(
+            self.conf['entry'], set([entries[0].id]), history)
+        self.assertEqual([e.title for e in entries],
+                         ['Entry2 Title', 'Entry3 Title'])
+
+    def test_fetch_entries_stream_invalid_context(self):
+        entry_conf = {'stream': True, 'xpath': {'context': '//div/div'}}
+        self.assertRaises(ConfigInvalidXPath, self.feed.fetch_entries,
+                          entry_conf)
+
 
 class TestAtomFeed(unittest.TestCase):
     def setUp(self):
@@ -127,5 +307,39 @@ class TestEntry(unittest.TestCase):
                          'uncreative test title')
 
 
+class TestEntryBatch(unittest.TestCase):
+    def setUp(self):
+        self.entries = []
+        for i in range(3):
+            entry = feed.Entry()
+            entry.id = 'id-{0}'.format(i)
+            entry.title = 'Title {0}'.format(i)
+            self.entries.append(entry)
+        self.batch = feed.EntryBatch(self.entries)
+
+    def test_rows(self):
+        """
+        Test that rows read and write the batch's columns.
+        """
+        self.assertEqual(len(self.batch), 3)
+        self.assertEqual([e.id for e in self.batch], ['id-0', 'id-1', 'id-2'])
+        self.assertEqual(self.batch[-1].title, 'Title 2')
+        self.assertEqual(self.batch[0].content, '')
+        self.batch[1].title = 'Changed'
+        self.assertEqual(self.batch.columns['title'][1], 'Changed')
+        self.assertEqual([e.id for e in self.batch[1:]], ['id-1', 'id-2'])
+        self.assertRaises(IndexError, lambda: self.batch[3])
+
+    def test_generate(self):
+        """
+        Test that a feed renders the same from a batch as from a list.
+        """
+        rss_feed = feed.get_feed('rss')
+        rss_feed.entries = self.entries
+        expected = rss_feed.xml()
+        rss_feed.entries = self.batch
+        self.assertEqual(rss_feed.xml(), expected)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_fetcher
+------------
+
+Tests for `parsescrapegenerate.fetcher` module.
+"""
+import gzip
+import shutil
+import sys
+import tempfile
+import threading
+
+if sys.version_info[:2] < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from parsescrapegenerate import feed, fetcher, utils
+from parsescrapegenerate.exceptions import ConfigIsNotValid, PageTooLarge
+
+PAGE = u'<html><head><title>Caf\xe9</title></head><body></body></html>'
+META_PAGE = (u'<html><head><meta charset="utf-8"><title>Caf\xe9</title>'
+             u'</head><body></body></html>')
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """
+    Fails the first request to each path with a 503.
+    """
+    seen = set()
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if self.path not in self.seen:
+            self.seen.add(self.path)
+            self.send_response(503)
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        if self.path.startswith('/page'):
+            body = gzip.compress(PAGE.encode('latin-1'))
+            content_type = 'text/html; charset=ISO-8859-1'
+        elif self.path.startswith('/meta'):
+            body = META_PAGE.encode('utf-8')
+            content_type = 'text/html'
+        elif self.path.startswith('/utf8'):
+            body = PAGE.encode('utf-8')
+            content_type = 'text/html; charset=utf-8'
+        elif self.path.startswith('/latin'):
+            body = META_PAGE.replace('utf-8', 'iso-8859-1').encode('latin-1')
+            content_type = 'text/html'
+        else:
+            body = 'ok {0}'.format(self.path).encode('utf-8')
+            content_type = 'text/plain; charset=utf-8'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        if self.path.startswith('/page'):
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', '"v1"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestFetcher(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(('127.0.0.1', 0), FlakyHandler)
+        cls.base = 'http://127.0.0.1:{0}'.format(cls.server.server_port)
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_retry(self):
+        """
+        Test that 5xx responses are retried.
+        """
+        f = fetcher.Fetcher(retries=2, backoff=0)
+        self.assertEqual(f.get_text(self.base + '/retry'), 'ok /retry')
+
+    def test_conditional_get(self):
+        """
+        Test that cached responses are revalidated and reused on a 304.
+        """
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        f = fetcher.Fetcher.from_settings(
+            {'retries': 2, 'backoff': 0, 'cache': {'dir': cache_dir}})
+        url = self.base + '/cached'
+        self.assertEqual(f.get_text(url), 'ok /cached')
+        self.assertEqual(f.get_text(url), 'ok /cached')
+        self.assertEqual(f.cache.get(url).etag, '"v1"')
+
+    def test_cache_ttl(self):
+        """
+        Test that fresh cached responses are served without a request.
+        """
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        f = fetcher.Fetcher.from_settings({
+            'retries': 2, 'backoff': 0,
+            'cache': {'dir': cache_dir, 'ttl': 60}
+        })
+        url = self.base + '/fresh'
+        f.get_text(url)
+        count = len(FlakyHandler.requests)
+        self.assertEqual(f.get_text(url), 'ok /fresh')
+        self.assertEqual(len(FlakyHandler.requests), count)
+
+    def test_get_tree(self):
+        """
+        Test that compressed pages are parsed using the HTTP charset.
+        """
+        f = fetcher.Fetcher(retries=2, backoff=0)
+        tree = f.get_tree(self.base + '/page')
+        self.assertEqual(tree.xpath('//title/text()'), [u'Caf\xe9'])
+
+    def test_get_tree_cached(self):
+        """
+        Test that cached pages are parsed and decoded using the HTTP charset
+        too, and otherwise the one declared in the page, as uncached ones are.
+        """
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        cached = fetcher.Fetcher.from_settings(
+            {'retries': 2, 'backoff': 0, 'cache': {'dir': cache_dir}})
+        uncached = fetcher.Fetcher(retries=2, backoff=0)
+        for f in (uncached, cached):
+            for path in ('/page-cached', '/meta-cached', '/latin-cached'):
+                for _ in range(2):
+                    tree = f.get_tree(self.base + path)
+                    self.assertEqual(tree.xpath('//title/text()'),
+                                     [u'Caf\xe9'])
+                    self.assertIn(u'<title>Caf\xe9</title>',
+                                  f.get_text(self.base + path))
+                    self.assertEqual(utils.get_content(
+                        self.base + path, '//title', f), u'Caf\xe9')
+
+    def test_stream_charset(self):
+        """
+        Test that streamed pages are parsed using the HTTP charset.
+        """
+        f = fetcher.Fetcher(retries=2, backoff=0)
+        page = feed.get_feed()
+        page.link = self.base + '/utf8-stream'
+        page.fetcher = f
+        entries = page.fetch_entries({
+            'stream': True,
+            'xpath': {'context': '//head', 'title': 'title/text()'},
+        })
+        self.assertEqual([e.title for e in entries], [u'Caf\xe9'])
+        self.assertEqual(page.fetch_title(), u'Caf\xe9')
+
+    def test_get_tree_too_large(self):
+        f = fetcher.Fetcher(retries=2, backoff=0, max_page_size=10)
+        self.assertRaises(PageTooLarge, f.get_tree, self.base + '/page-large')
+
+    def test_get_charset(self):
+        self.assertEqual(
+            fetcher.get_charset({'Content-Type': 'text/html; charset="utf-8"'}),
+            'utf-8')
+        self.assertIsNone(fetcher.get_charset({'Content-Type': 'text/html'}))
+
+    def test_from_settings(self):
+        f = fetcher.Fetcher.from_settings(
+            {'timeout': {'connect': 1, 'read': 2}, 'user_agent': 'test'})
+        self.assertEqual(f.timeout, (1, 2))
+        self.assertEqual(f.session.headers['User-Agent'], 'test')
+
+    def test_from_settings_invalid(self):
+        self.assertRaises(ConfigIsNotValid, fetcher.Fetcher.from_settings,
+                          {'foo': 1})
+
+    def test_get_fetcher_shared(self):
+        """
+        Test that feeds with the same settings share a fetcher.
+        """
+        self.assertIs(fetcher.get_fetcher({'retries': 1}),
+                      fetcher.get_fetcher({'retries': 1}))
+
+
+if __name__ == '__main__':
+    unittest.main()
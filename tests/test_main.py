@@ -6,15 +6,26 @@ test_main
 
 Tests for `parsescrapegenerate.main` module.
 """
+import gzip
+import io
+import os
+import shutil
 import sys
+import tempfile
+import time
 
 if sys.version_info[:2] < (2, 7):
     import unittest2 as unittest
 else:
     import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
 
 from feedparser import FeedParserDict
-from parsescrapegenerate import config, feed, main
+from lxml import etree
+from parsescrapegenerate import config, feed, main, stats
 
 class TestMain(unittest.TestCase):
     def test_parse(self):
@@ -31,8 +42,134 @@ class TestMain(unittest.TestCase):
         conf = config.get_config('tests/test-config/valid-config.yml')
         self.assertIsInstance(main.scrape(conf), feed.RssFeed)
 
+    def test_scrape_merges_input_entries(self):
+        """
+        Test that the entries of the input feed are kept after the new ones,
+        newest first, and capped by max_entries. Entries whose link is in the
+        input feed keep their id, so are not scraped again.
+        """
+        conf = config.get_config('tests/test-config/valid-config.yml')
+        with io.open('tests/test-fastparse/rss.xml', encoding='utf-8') as f:
+            source = f.read()
+        for fast in (False, True):
+            new_feed = main.scrape(conf, main.parse(source, fast))
+            self.assertEqual([e.title for e in new_feed.entries],
+                             ['Entry3 Title', 'Entry1 Title', 'Entry2 Title'])
+            self.assertEqual(new_feed.entries[1].content,
+                             '<p>Entry1 Content</p>')
+            self.assertEqual(new_feed.entries[2].published,
+                             'Mon, 30 Jun 2014 03:12:39 Z')
+
+        conf['max_entries'] = 2
+        new_feed = main.scrape(conf, main.parse(source))
+        self.assertEqual(len(new_feed.entries), 2)
+
+    def test_scrape_input_entries_without_id(self):
+        """
+        Test that input entries without an id are kept, by either parser.
+        """
+        conf = config.get_config('tests/test-config/valid-config.yml')
+        source = ('<rss version="2.0"><channel><title>Old</title><item>'
+                  '<title>No Guid</title><link>http://example.com/old</link>'
+                  '<pubDate>Tue, 01 Jul 2014 03:12:39 Z</pubDate>'
+                  '</item></channel></rss>')
+        for fast in (False, True):
+            new_feed = main.scrape(conf, main.parse(source, fast))
+            self.assertEqual([e.title for e in new_feed.entries][-1],
+                             'No Guid')
+
+    def test_scrape_input_entries_escaped(self):
+        """
+        Test that input entries with markup characters are written back
+        well-formed and unchanged, round after round, by either parser.
+        """
+        conf = config.get_config('tests/test-config/valid-config.yml')
+        source = ('<rss version="2.0"><channel><title>Old</title><item>'
+                  '<guid>http://example.com/?a=1&amp;b=2</guid>'
+                  '<title>Fish &amp; Chips &lt;3</title>'
+                  '<link>http://example.com/?a=1&amp;b=2</link>'
+                  '<pubDate>Tue, 01 Jul 2014 03:12:39 Z</pubDate>'
+                  '</item></channel></rss>')
+        for fast in (False, True):
+            xml = source
+            for _ in range(2):
+                xml = main.generate(main.scrape(conf, main.parse(xml, fast)))
+                entries = etree.fromstring(xml.encode('utf-8')).findall(
+                    'channel/item')
+                self.assertEqual(len(entries), 4)
+                self.assertEqual(entries[-1].findtext('title'),
+                                 'Fish & Chips <3')
+                self.assertEqual(entries[-1].findtext('guid'),
+                                 'http://example.com/?a=1&b=2')
+
+    def test_scrape_keeps_document_order(self):
+        """
+        Test that entries scraped while the clock moves on keep their
+        document order.
+        """
+        conf = config.get_config('tests/test-config/valid-config.yml')
+        gmtime = time.gmtime
+        ticks = iter(range(1404184359, 1404184459))
+        with mock.patch.object(time, 'gmtime',
+                               side_effect=lambda *args: gmtime(next(ticks))):
+            new_feed = main.scrape(conf)
+        self.assertEqual([e.title for e in new_feed.entries],
+                         ['Entry1 Title', 'Entry2 Title', 'Entry3 Title'])
+
+    def test_scrape_stats_hook(self):
+        """
+        Test that stats hooks get a report of each scrape on its own.
+        """
+        conf = config.get_config('tests/test-config/valid-config.yml')
+        reports = []
+        stats.add_hook(reports.append)
+        try:
+            main.scrape(conf)
+            main.scrape(conf)
+        finally:
+            stats.remove_hook(reports.append)
+        self.assertEqual(len(reports), 2)
+        for report in reports:
+            self.assertEqual(report['feed'], conf['path'])
+            self.assertEqual(report['timings']['fetch_entries']['count'], 1)
+
     def test_generate(self):
-        pass
+        """
+        Test that `main.generate` returns the feed as XML, either as a string
+        or as an iterator of chunks.
+        """
+        conf = config.get_config('tests/test-config/valid-config.yml')
+        new_feed = main.scrape(conf)
+        xml = main.generate(new_feed)
+        self.assertTrue(xml.startswith('<?xml'))
+        self.assertEqual(''.join(main.generate(new_feed, stream=True)), xml)
+
+    def test_write(self):
+        conf = config.get_config('tests/test-config/valid-config.yml')
+        new_feed = main.scrape(conf)
+        out = io.StringIO()
+        main.write(new_feed, out)
+        self.assertEqual(out.getvalue(), main.generate(new_feed))
+
+    def test_write_file(self):
+        """
+        Test that a feed is only written again once its entries change.
+        """
+        conf = config.get_config('tests/test-config/valid-config.yml')
+        new_feed = main.scrape(conf)
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'feed.xml')
+        self.assertTrue(main.write_file(new_feed, path, compress=True))
+        with io.open(path, encoding='utf-8') as f:
+            self.assertEqual(f.read(), main.generate(new_feed))
+        with gzip.open(path + '.gz') as f:
+            self.assertEqual(f.read().decode('utf-8'), main.generate(new_feed))
+
+        new_feed.updated = 'later'
+        self.assertFalse(main.write_file(new_feed, path, compress=True))
+        new_feed.entries[0].title = 'Changed'
+        self.assertTrue(main.write_file(new_feed, path))
 
 
 if __name__ == '__main__':
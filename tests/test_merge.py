@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_merge
+----------
+
+Tests for `parsescrapegenerate.merge` module.
+"""
+import sys
+import time
+
+if sys.version_info[:2] < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from parsescrapegenerate import feed, merge
+
+DATE_FORMAT = feed.RssFeed.DATE_FORMAT
+
+def make_entry(entry_id):
+    entry = feed.Entry()
+    entry.id = entry_id
+    return entry
+
+
+class TestMerge(unittest.TestCase):
+    def test_merge_entries(self):
+        """
+        Test that entries are merged newest first, across unordered sources,
+        with undated entries last.
+        """
+        new = [(50, make_entry('a')), (50, make_entry('b'))]
+        old = [(40, make_entry('c')), (10, make_entry('d')),
+               (None, make_entry('e')), (45, make_entry('f')),
+               (20, make_entry('g'))]
+        merged = merge.merge_entries([new, old])
+        self.assertEqual([e.id for e in merged],
+                         ['a', 'b', 'f', 'c', 'g', 'd', 'e'])
+
+    def test_merge_entries_limits(self):
+        old = [(i, make_entry(str(i))) for i in range(10, 0, -1)]
+        self.assertEqual([e.id for e in merge.merge_entries([old], 3)],
+                         ['10', '9', '8'])
+        self.assertEqual([e.id for e in merge.merge_entries([old], None, 8)],
+                         ['10', '9', '8'])
+
+    def test_from_input_entries(self):
+        """
+        Test that input entries are converted, skipping duplicate ids.
+        """
+        items = [
+            {'id': 'a', 'title': 'A', 'summary': 'Summary',
+             'published_parsed': time.gmtime(0)},
+            {'id': 'b', 'content': [{'value': 'Content'}],
+             'published': 'yesterday'},
+            {'id': 'a'},
+            {'id': 'c'},
+        ]
+        pairs = list(merge.from_input_entries(items, DATE_FORMAT, ['c']))
+        self.assertEqual([(t, e.id) for t, e in pairs], [(0, 'a'), (None, 'b')])
+        self.assertEqual(pairs[0][1].content, 'Summary')
+        self.assertEqual(pairs[0][1].published, 'Thu, 01 Jan 1970 00:00:00 Z')
+        self.assertEqual(pairs[1][1].content, 'Content')
+        self.assertEqual(pairs[1][1].published, 'yesterday')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_state
+----------
+
+Tests for `parsescrapegenerate.state` module.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import warnings
+
+if sys.version_info[:2] < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from parsescrapegenerate import config, main, state
+
+class TestSeenStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = state.SeenStore(os.path.join(self.directory, 'seen.db'))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_add(self):
+        self.store.add(['a', 'b', ''])
+        self.assertIn('a', self.store)
+        self.assertNotIn('c', self.store)
+        self.assertEqual(len(self.store), 2)
+
+    def test_prune(self):
+        """
+        Test that ids not seen within the retention period are forgotten.
+        """
+        self.store.add(['old'], now=0)
+        self.store.add(['new'], now=10 * state.DAY)
+        self.store.prune(5, now=10 * state.DAY)
+        self.assertNotIn('old', self.store)
+        self.assertIn('new', self.store)
+
+    def test_links(self):
+        """
+        Test that the id given to a link is kept, with its first seen time,
+        until the id is pruned.
+        """
+        self.store.add(['a'], now=0)
+        self.store.add_links([('http://example.com/a', 'a'), ('', 'b')])
+        self.store.add_links([('http://example.com/a', 'other')])
+        self.store.add(['a'], now=10 * state.DAY)
+        self.assertEqual(self.store.get_link('http://example.com/a'),
+                         ('a', 0))
+        self.assertIsNone(self.store.get_link('http://example.com/b'))
+        self.store.prune(5, now=20 * state.DAY)
+        self.assertIsNone(self.store.get_link('http://example.com/a'))
+
+    def test_known_ids(self):
+        self.store.add(['a'])
+        known = state.KnownIds(set(['b']), self.store)
+        self.assertIn('a', known)
+        self.assertIn('b', known)
+        self.assertNotIn('c', known)
+        self.assertEqual(known.hits, ['a'])
+
+    def test_scrape_with_state(self):
+        """
+        Test that entries seen by a previous scrape are not repeated, without
+        the previous feed being given, and that leaving them out warns.
+        """
+        conf = config.get_config('tests/test-config/valid-config.yml')
+        conf['state'] = {'dir': self.directory}
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            first = main.scrape(conf)
+            self.assertEqual(caught, [])
+            self.assertEqual(len(main.scrape(conf).entries), 0)
+            self.assertEqual(len(caught), 1)
+            self.assertIn('3 known entries', str(caught[0].message))
+            second = main.scrape(conf, main.parse(main.generate(first)))
+            self.assertEqual(len(caught), 1)
+        self.assertEqual(len(first.entries), 3)
+        self.assertEqual(len(second.entries), 3)
+
+        history = state.EntryHistory([], state.get_seen_store(conf))
+        entry_id, first_seen = history.get('http://example.com/entry1.html')
+        self.assertTrue(entry_id.startswith('tag:example.com,'))
+        history.store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
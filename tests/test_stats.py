@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_stats
+----------
+
+Tests for `parsescrapegenerate.stats` module.
+"""
+import sys
+import threading
+
+if sys.version_info[:2] < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from parsescrapegenerate import stats
+
+class TestStats(unittest.TestCase):
+    def setUp(self):
+        self.stats = stats.Stats()
+
+    def test_report(self):
+        for seconds in range(1, 101):
+            self.stats.record('stage', seconds)
+        self.stats.incr('bytes', 10)
+        self.stats.incr('bytes', 5)
+        report = self.stats.report()
+        timing = report['timings']['stage']
+        self.assertEqual(timing['count'], 100)
+        self.assertEqual(timing['total'], 5050)
+        self.assertEqual(timing['p50'], 51)
+        self.assertEqual(timing['p99'], 100)
+        self.assertEqual(report['counters'], {'bytes': 15})
+
+    def test_timer(self):
+        with self.stats.timer('stage'):
+            pass
+        self.assertEqual(self.stats.report()['timings']['stage']['count'], 1)
+
+    def test_hooks(self):
+        reports = []
+        self.stats.add_hook(reports.append)
+        self.stats.incr('calls')
+        self.stats.emit()
+        self.stats.remove_hook(reports.append)
+        self.stats.emit()
+        self.assertEqual(reports, [{'timings': {}, 'counters': {'calls': 1}}])
+
+    def test_collect(self):
+        """
+        Test that collected stats only hold what the collecting thread, and
+        the work it binds, records.
+        """
+        def other():
+            stats.incr('test.collect')
+
+        with stats.collect() as outer:
+            stats.incr('test.collect')
+            with stats.collect() as inner:
+                with stats.timer('test.collect'):
+                    pass
+                thread = threading.Thread(target=other)
+                thread.start()
+                thread.join()
+                thread = threading.Thread(target=stats.bind(other))
+                thread.start()
+                thread.join()
+        stats.incr('test.collect')
+        self.assertEqual(outer.report()['counters'], {'test.collect': 2})
+        self.assertEqual(inner.report()['counters'], {'test.collect': 1})
+        self.assertEqual(
+            inner.report()['timings']['test.collect']['count'], 1)
+
+    def test_timed(self):
+        """
+        Test that decorated functions are recorded in the shared stats.
+        """
+        stats.reset()
+        stats.timed('decorated')(lambda: None)()
+        self.assertEqual(stats.report()['timings']['decorated']['count'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,19 +6,44 @@ test_utils
 
 Tests for `parsescrapegenerate.utils` module.
 """
+import os
+import shutil
+import stat
 import sys
+import tempfile
 
 if sys.version_info[:2] < (2, 7):
     import unittest2 as unittest
 else:
     import unittest
+try:
+    from unittest import mock
+except ImportError:
+    import mock
 
+from lxml import html
 from parsescrapegenerate import utils
 
 class TestUtils(unittest.TestCase):
     def test_get_clean_html(self):
         self.assertEqual(utils.get_clean_html(' <p>foobar</p> '), 'foobar')
 
+    def test_get_clean_html_element(self):
+        """
+        Test that elements are cleaned without their tail text.
+        """
+        tree = html.fromstring(
+            '<div><p onclick="x()">foo <a href="/bar">bar</a></p>tail</div>')
+        self.assertEqual(utils.get_clean_html(tree[0]),
+                         'foo <a href="/bar" rel="nofollow">bar</a>')
+        self.assertEqual(tree[0].get('onclick'), 'x()')
+
+    def test_get_clean_html_list(self):
+        tree = html.fromstring('<div><p>foo</p><script>x</script></div>')
+        self.assertEqual(
+            utils.get_clean_html_list([tree[0], tree[1], 'a &amp; b']),
+            ['foo', '', 'a &amp; b'])
+
     def test_get_content(self):
         self.assertEqual(
             utils.get_content('tests/test-main/sample.html',
@@ -33,6 +58,67 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(
             utils.render_template('foo{{ bar }}', {'bar':'quux'}), 'fooquux')
 
+    def test_get_template_cached(self):
+        """
+        Test that the same template source is only compiled once.
+        """
+        self.assertIs(utils.get_template('cached{{ bar }}'),
+                      utils.get_template('cached{{ bar }}'))
+
+    def test_compile_templates(self):
+        templates = utils.compile_templates({'title': 'foo{{ bar }}'})
+        self.assertEqual(
+            utils.render_template(templates['title'], {'bar':'quux'}),
+            'fooquux')
+
+    def test_get_xpath_plan(self):
+        plan = utils.get_xpath_plan({'context': '//div', 'title': 'h2/text()'})
+        self.assertEqual([key for key, query in plan.fields], ['title'])
+        self.assertIs(plan, utils.get_xpath_plan(
+            {'title': 'h2/text()', 'context': '//div'}))
+
+    def test_lru_cache(self):
+        cache = utils.LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_lru_cache_sized(self):
+        cache = utils.LRUCache(10)
+        cache.set('a', 1, 6)
+        cache.set('b', 2, 6)
+        self.assertNotIn('a', cache)
+        self.assertIn('b', cache)
+
+    def test_write_atomic_mode(self):
+        """
+        Test that new files get the default mode for the umask, and
+        replaced files keep their mode without the umask being read.
+        """
+        umask = os.umask(0o077)
+        os.umask(umask)
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'out.xml')
+        utils.write_atomic(path, 'new')
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode),
+                         0o666 & ~umask)
+        utils.write_atomic(path + '.gz', 'new', compress=True)
+        self.assertEqual(stat.S_IMODE(os.stat(path + '.gz').st_mode),
+                         0o666 & ~umask)
+        os.chmod(path, 0o640)
+        with mock.patch.object(utils, '_umask', None), \
+                mock.patch.object(os, 'umask') as umask_call:
+            utils.write_atomic(path, 'replaced')
+        self.assertFalse(umask_call.called)
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o640)
+        with open(path) as f:
+            self.assertEqual(f.read(), 'replaced')
+
 
 if __name__ == '__main__':
     unittest.main()